@@ -0,0 +1,48 @@
+"""Check how long importing the CLI takes, and fail if it is over budget.
+
+Imports naptha_sdk.cli in fresh interpreters and reports the best time, plus the slowest modules
+of that run, so a heavy top-level import creeping back in shows up.
+
+    python benchmarks/cli_import_time.py --budget-ms 250
+"""
+import argparse
+import subprocess
+import sys
+
+
+def import_time(module):
+    """Return (total microseconds, [(cumulative microseconds, module name)]) for importing module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules.append((int(cumulative), name.strip()))
+    total = next(cumulative for cumulative, name in reversed(modules) if name == module)
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="naptha_sdk.cli", help="Module to import")
+    parser.add_argument("--budget-ms", type=float, default=250, help="Fail if the best import time is above this")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters to time")
+    args = parser.parse_args()
+
+    best_total, best_modules = min(import_time(args.module) for _ in range(args.repeat))
+    print(f"import {args.module}: best {best_total / 1000:.0f} ms over {args.repeat} runs (budget {args.budget_ms:.0f} ms)")
+    for cumulative, name in sorted(best_modules, reverse=True)[1:11]:
+        print(f"  {cumulative / 1000:7.1f} ms  {name}")
+
+    if best_total / 1000 > args.budget_ms:
+        print("Over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
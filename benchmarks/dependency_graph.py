@@ -0,0 +1,67 @@
+"""Benchmark building and sorting the dependency graph of scraped local modules.
+
+Generates a synthetic project of classes that each subclass and call a few earlier classes,
+with some string literals and comments mentioning other class names, then times
+build_dependency_graph and sort_modules on it.
+
+    python benchmarks/dependency_graph.py --modules 1000
+"""
+import argparse
+import random
+import time
+
+from naptha_sdk.package_manager import build_dependency_graph, sort_modules
+
+
+def make_modules(count, max_deps=5, seed=0):
+    rng = random.Random(seed)
+    modules = []
+    for i in range(count):
+        name = f"Module{i}"
+        deps = rng.sample(range(i), min(i, rng.randint(0, max_deps)))
+        base = f"Module{deps[0]}" if deps else "object"
+        body = "\n".join(f"        self.m{dep} = Module{dep}()" for dep in deps[1:]) or "        pass"
+        unrelated = f"Module{rng.randrange(count)}"
+        source = (
+            f"class {name}({base}):\n"
+            f"    \"\"\"Not a dependency on {unrelated}.\"\"\"\n"
+            f"    label = '{unrelated}'  # nor {unrelated}\n"
+            f"    def __init__(self):\n"
+            f"{body}\n"
+            + "\n".join(f"    def method_{j}(self, x):\n        return x * {j}\n" for j in range(20))
+        )
+        modules.append({"name": name, "source": source, "deps": {f"Module{dep}" for dep in deps}})
+    rng.shuffle(modules)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=1000, help="Number of synthetic modules")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs")
+    args = parser.parse_args()
+
+    modules = make_modules(args.modules)
+    size = sum(len(mod["source"]) for mod in modules)
+    print(f"{len(modules)} modules, {size / 1024:.0f} KiB of source")
+
+    build_times, sort_times = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        dependencies = build_dependency_graph(modules)
+        build_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ordered = sort_modules(modules, dependencies)
+        sort_times.append(time.perf_counter() - start)
+
+    assert all(set(dependencies[mod["name"]]) == mod["deps"] for mod in modules)
+    position = {mod["name"]: i for i, mod in enumerate(ordered)}
+    assert all(position[dep] < position[mod["name"]] for mod in modules for dep in mod["deps"])
+
+    print(f"build_dependency_graph: best {min(build_times) * 1000:.1f} ms")
+    print(f"sort_modules:           best {min(sort_times) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the node wire codecs on AgentRun payloads.
+
+Builds an AgentRun with --results results of --result-kb KB each, then times encoding it for the
+wire and decoding it back into an AgentRun with the old path (model_dump + json.dumps,
+json.loads of the response text + AgentRun(**data)) and with each available codec.
+
+    python benchmarks/node_codecs.py --results 50 --result-kb 8
+"""
+import argparse
+import json
+import random
+import string
+import time
+import warnings
+
+warnings.filterwarnings("ignore", message="Valid config keys have changed in V2")
+
+from naptha_sdk.client.codec import CODECS, get_codec  # noqa: E402
+from naptha_sdk.schemas import AgentConfig, AgentDeployment, AgentRun, LLMConfig  # noqa: E402
+
+
+def make_agent_run(results, result_kb, seed=0):
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(2000)]
+
+    def text(size):
+        out, length = [], 0
+        while length < size:
+            word = rng.choice(words)
+            out.append(word)
+            length += len(word) + 1
+        return " ".join(out)
+
+    deployment = AgentDeployment(
+        name="agent_deployment",
+        module={"name": "hello_world_agent", "type": "package", "url": "https://github.com/NapthaAI/hello_world_agent"},
+        worker_node_url="http://localhost:7001",
+        agent_config=AgentConfig(
+            llm_config=LLMConfig(client="openai", model="gpt-4o-mini", max_tokens=1000, temperature=0.7),
+            persona_module={"url": "https://huggingface.co/datasets/NapthaAI/twitter_personas", "data": {"bio": text(500)}},
+            system_prompt={"role": text(200), "persona": text(300)},
+        ),
+    )
+    return AgentRun(
+        consumer_id="user:" + "".join(rng.choices(string.hexdigits, k=64)),
+        inputs={"tool_name": "chat", "tool_input_data": text(1000), "history": [text(200) for _ in range(10)]},
+        agent_deployment=deployment,
+        status="completed",
+        id="agent_run:" + "".join(rng.choices(string.ascii_lowercase + string.digits, k=20)),
+        results=[json.dumps({"role": "assistant", "content": text(result_kb * 1024)}) for _ in range(results)],
+        created_time="2024-11-20T10:00:00.000000",
+        start_processing_time="2024-11-20T10:00:00.100000",
+        completed_time="2024-11-20T10:00:12.345678",
+        duration=12.245678,
+    )
+
+
+def timeit(func, min_time=0.5):
+    number, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / number
+        number *= 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, default=50, help="Number of results in the run")
+    parser.add_argument("--result-kb", type=int, default=8, help="Size of each result in KB")
+    args = parser.parse_args()
+
+    run = make_agent_run(args.results, args.result_kb)
+    rows = []
+
+    body = json.dumps(run.model_dump()).encode()
+    rows.append((
+        "model_dump + json (old)", len(body),
+        timeit(lambda: json.dumps(run.model_dump()).encode()),
+        timeit(lambda: AgentRun(**json.loads(body.decode()))),
+    ))
+    for name in CODECS:
+        try:
+            codec = get_codec(name)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        body = codec.encode(run)
+        assert codec.decode_model(body, AgentRun) == run, f"{name} did not round-trip"
+        rows.append((
+            name, len(body),
+            timeit(lambda: codec.encode(run)),
+            timeit(lambda: codec.decode_model(body, AgentRun)),
+        ))
+
+    print(f"AgentRun with {args.results} results of {args.result_kb} KB")
+    print(f"{'codec':<26}{'size KB':>10}{'encode ms':>12}{'decode ms':>12}")
+    for name, size, encode, decode in rows:
+        print(f"{name:<26}{size / 1024:>10.1f}{encode * 1000:>12.3f}{decode * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark Services.list_services against a local stand-in for the payments client.
+
+The stand-in answers each call after a fixed delay, like a round-trip to the marketplace, and
+records how many calls were in flight at once. Lists a plan with --services services cold,
+then again from the DDO cache.
+
+    python benchmarks/services_listing.py --services 50 --latency-ms 100 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+from naptha_sdk.client.services import Services
+
+
+class _Response:
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+
+class StandInPayments:
+    """Answers the payments calls Services makes, after `latency` seconds each."""
+
+    def __init__(self, services, latency):
+        self.dids = [f"did:nv:{i:064x}" for i in range(services)]
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _respond(self, data):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        return _Response(data)
+
+    def get_subscription_associated_services(self, plan_did):
+        return self._respond(self.dids)
+
+    def get_asset_ddo(self, did):
+        return self._respond({"service": [{"attributes": {"main": {"name": f"service-{self.dids.index(did)}"}}}]})
+
+    def get_service_token(self, did):
+        return self._respond({"token": {"accessToken": f"token-{did[-4:]}", "neverminedProxyUri": "http://localhost:3100"}})
+
+
+async def run(args):
+    payments = StandInPayments(args.services, args.latency_ms / 1000)
+    services = Services(payments=payments, concurrency=args.concurrency)
+
+    start = time.perf_counter()
+    names = await services.list_services()
+    cold = time.perf_counter() - start
+    assert names == [f"service-{i}" for i in range(args.services)], "services out of order"
+    cold_calls = payments.calls
+
+    start = time.perf_counter()
+    await services.list_services()
+    warm = time.perf_counter() - start
+
+    calls = payments.calls
+    await asyncio.gather(*(services.get_service_details(payments.dids[0]) for _ in range(10)))
+    token_calls = payments.calls - calls
+
+    serial = (args.services + 1) * args.latency_ms / 1000
+    print(f"cold listing: {cold * 1000:.0f} ms, {cold_calls} calls, at most {payments.max_in_flight} in flight "
+          f"(serial would take ~{serial * 1000:.0f} ms)")
+    print(f"cached listing: {warm * 1000:.0f} ms, 1 call")
+    print(f"10 concurrent token lookups for one service: {token_calls} call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", type=int, default=50, help="Number of services in the plan")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Delay of each stand-in call")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent DDO fetches")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+from naptha_sdk.utils import get_logger
+
+logger = get_logger(__name__)
+
+NAPTHA_CACHE_DIR = os.getenv("NAPTHA_CACHE_DIR", str(Path.home() / ".naptha" / "cache"))
+
+def get_cache_path(*parts) -> Path:
+    """Return a path inside the local Naptha cache, without creating anything."""
+    return Path(NAPTHA_CACHE_DIR, *parts)
+
+def get_cache_dir(*parts) -> Path:
+    """Return (and create) a directory inside the local Naptha cache."""
+    cache_dir = get_cache_path(*parts)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+class FileCache:
+    """A small JSON file cache with per-entry expiry, shared between processes.
+
+    Entries are stored as {key: {"value": ..., "expires_at": ...}}. The file is
+    re-read on every lookup so that concurrent CLI invocations see each other's
+    writes, and rewritten atomically on every update. The cache directory is only
+    created on the first write, so creating a FileCache never touches the disk. Updates from
+    threads of one process are serialized so they don't overwrite each other.
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = None, secure: bool = False):
+        self.path = get_cache_path(f"{name}.json")
+        self.ttl = ttl
+        self.secure = secure
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self.path}: {e}")
+            return {}
+
+    def _dump(self, entries: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            if self.secure:
+                os.chmod(tmp_path, 0o600)
+            with os.fdopen(fd, "w") as file:
+                json.dump(entries, file)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._load().get(key)
+        if entry is None:
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+        with self._lock:
+            now = time.time()
+            entries = {
+                k: v for k, v in self._load().items()
+                if v.get("expires_at") is None or v["expires_at"] > now
+            }
+            entries[key] = {"value": value, "expires_at": expires_at}
+            try:
+                self._dump(entries)
+            except OSError as e:
+                logger.warning(f"Could not write cache file {self.path}: {e}")
+
+    def keys(self) -> List[str]:
+        """Return the keys of the entries that haven't expired."""
+        now = time.time()
+        return [k for k, v in self._load().items() if v.get("expires_at") is None or v["expires_at"] > now]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                try:
+                    self._dump(entries)
+                except OSError as e:
+                    logger.warning(f"Could not write cache file {self.path}: {e}")
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -1,180 +1,209 @@
 import argparse
 import asyncio
+import hashlib
 import json
+import logging
 import os
 import shlex
+import sys
+import time
 from textwrap import wrap
 
 import yaml
 from dotenv import load_dotenv
 from tabulate import tabulate
 
-from naptha_sdk.client.hub import user_setup_flow
-from naptha_sdk.client.naptha import Naptha
-from naptha_sdk.schemas import AgentConfig, AgentDeployment, ChatCompletionRequest, EnvironmentDeployment, \
-    OrchestratorDeployment, \
-    OrchestratorRunInput, EnvironmentRunInput
+# Only lightweight modules are imported here so that --help and cached listings start quickly; the
+# hub, node and schema modules are imported by the commands that use them
+from naptha_sdk.client.hub import LIST_PAGE_SIZE, user_setup_flow
+from naptha_sdk.client.naptha import Naptha, load_agent_module
+from naptha_sdk.daemon import DAEMON_COMMANDS, daemon_command, send_command
 from naptha_sdk.user import get_public_key
 
 load_dotenv(override=True)
 
+BATCH_CONCURRENCY = int(os.getenv("NAPTHA_BATCH_CONCURRENCY", 4))
+
 def load_yaml_to_dict(file_path):
     with open(file_path, 'r') as file:
         # Load the YAML content into a Python dictionary
         yaml_content = yaml.safe_load(file)
     return yaml_content
 
-def creds(naptha):
-    return naptha.services.show_credits()
+async def creds(naptha):
+    return await naptha.services.show_credits()
 
-def list_services(naptha):
-    services = naptha.services.list_services()
+async def list_services(naptha):
+    services = await naptha.services.list_services()
     for service in services:
         print(service) 
 
-async def list_nodes(naptha):
-    nodes = await naptha.hub.list_nodes()
-    
-    if not nodes:
-        print("No nodes found.")
-        return
-
-    # Determine available keys
-    keys = list(nodes[0].keys())
-
-    # Create headers and table data based on available keys
-    headers = keys
-    table_data = []
+async def list_nodes(naptha, page_size=LIST_PAGE_SIZE, use_cache=True):
+    registry = naptha.registry if use_cache else naptha.hub
+    total = 0
+    keys = None
+
+    # Print each page of nodes as soon as it arrives
+    async for nodes in registry.iter_nodes(page_size=page_size):
+        # Determine available keys from the first page
+        if keys is None:
+            keys = list(nodes[0].keys())
+            print("\nAll Nodes:")
+
+        # Create headers and table data based on available keys
+        headers = keys
+        table_data = []
+
+        for node in nodes:
+            row = []
+            for key in keys:
+                value = str(node.get(key, ''))
+                if len(value) > 50:
+                    wrapped_value = '\n'.join(wrap(value, width=50))
+                    row.append(wrapped_value)
+                else:
+                    row.append(value)
+            table_data.append(row)
 
-    for node in nodes:
-        row = []
-        for key in keys:
-            value = str(node.get(key, ''))
-            if len(value) > 50:
-                wrapped_value = '\n'.join(wrap(value, width=50))
-                row.append(wrapped_value)
-            else:
-                row.append(value)
-        table_data.append(row)
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        total += len(nodes)
 
-    print("\nAll Nodes:")
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
-    print(f"\nTotal nodes: {len(nodes)}")
+    if not total:
+        print("No nodes found.")
+        return
+    print(f"\nTotal nodes: {total}")
 
-async def list_agents(naptha):
-    agents = await naptha.hub.list_agents()
-    
-    if not agents:
+async def list_agents(naptha, page_size=LIST_PAGE_SIZE, use_cache=True, **filters):
+    registry = naptha.registry if use_cache else naptha.hub
+    headers = ["Name", "ID", "Type", "Version", "Author", "Parameters", "Description"]
+    fields = ["name", "id", "type", "version", "author", "parameters", "description"]
+    total = 0
+
+    async for agents in registry.iter_agents(page_size=page_size, fields=fields, **filters):
+        table_data = []
+
+        for agent in agents:
+            # Wrap the description text
+            wrapped_description = '\n'.join(wrap(agent.get('description') or '', width=50))
+
+            row = [
+                agent.get('name'),
+                agent.get('id'),
+                agent.get('type'),
+                agent.get('version'),
+                agent.get('author'),
+                agent.get('parameters'),
+                wrapped_description
+            ]
+            table_data.append(row)
+
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        total += len(agents)
+
+    if not total:
         print("No agents found.")
         return
+    print(f"\nTotal agents: {total}")
 
+async def list_orchestrators(naptha, page_size=LIST_PAGE_SIZE, use_cache=True, **filters):
+    registry = naptha.registry if use_cache else naptha.hub
     headers = ["Name", "ID", "Type", "Version", "Author", "Parameters", "Description"]
-    table_data = []
-
-    for agent in agents:
-        # Wrap the description text
-        wrapped_description = '\n'.join(wrap(agent['description'], width=50))
-        
-        row = [
-            agent['name'],
-            agent['id'],
-            agent['type'],
-            agent['version'],
-            agent['author'],
-            agent['parameters'],
-            wrapped_description
-        ]
-        table_data.append(row)
-
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
-    print(f"\nTotal agents: {len(agents)}")
-
-async def list_orchestrators(naptha):
-    orchestrators = await naptha.hub.list_orchestrators()
-    
-    if not orchestrators:
+    fields = ["name", "id", "type", "version", "author", "parameters", "description"]
+    total = 0
+
+    async for orchestrators in registry.iter_orchestrators(page_size=page_size, fields=fields, **filters):
+        table_data = []
+
+        for orchestrator in orchestrators:
+            # Wrap the description text
+            wrapped_description = '\n'.join(wrap(orchestrator.get('description') or '', width=50))
+
+            row = [
+                orchestrator.get('name'),
+                orchestrator.get('id'),
+                orchestrator.get('type'),
+                orchestrator.get('version'),
+                orchestrator.get('author'),
+                orchestrator.get('parameters'),
+                wrapped_description
+            ]
+            table_data.append(row)
+
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        total += len(orchestrators)
+
+    if not total:
         print("No orchestrators found.")
         return
+    print(f"\nTotal orchestrators: {total}")
 
+async def list_environments(naptha, page_size=LIST_PAGE_SIZE, use_cache=True, **filters):
+    registry = naptha.registry if use_cache else naptha.hub
     headers = ["Name", "ID", "Type", "Version", "Author", "Parameters", "Description"]
-    table_data = []
-
-    for orchestrator in orchestrators:
-        # Wrap the description text
-        wrapped_description = '\n'.join(wrap(orchestrator['description'], width=50))
-        
-        row = [
-            orchestrator['name'],
-            orchestrator['id'],
-            orchestrator['type'],
-            orchestrator['version'],
-            orchestrator['author'],
-            orchestrator['parameters'],
-            wrapped_description
-        ]
-        table_data.append(row)
-
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
-    print(f"\nTotal orchestrators: {len(orchestrators)}")
-
-async def list_environments(naptha):
-    environments = await naptha.hub.list_environments()
-    
-    if not environments:
+    fields = ["name", "id", "type", "version", "author", "parameters", "description"]
+    total = 0
+
+    async for environments in registry.iter_environments(page_size=page_size, fields=fields, **filters):
+        table_data = []
+
+        for environment in environments:
+            # Wrap the description text
+            wrapped_description = '\n'.join(wrap(environment.get('description') or '', width=50))
+
+            row = [
+                environment.get('name'),
+                environment.get('id'),
+                environment.get('type'),
+                environment.get('version'),
+                environment.get('author'),
+                environment.get('parameters'),
+                wrapped_description
+            ]
+            table_data.append(row)
+
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        total += len(environments)
+
+    if not total:
         print("No environments found.")
         return
+    print(f"\nTotal environments: {total}")
 
-    headers = ["Name", "ID", "Type", "Version", "Author", "Parameters", "Description"]
-    table_data = []
-
-    for environment in environments:
-        # Wrap the description text
-        wrapped_description = '\n'.join(wrap(environment['description'], width=50))
-        
-        row = [
-            environment['name'],
-            environment['id'],
-            environment['type'],
-            environment['version'],
-            environment['author'],
-            environment['parameters'],
-            wrapped_description
-        ]
-        table_data.append(row)
-
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
-    print(f"\nTotal environments: {len(environments)}")
-
-async def list_personas(naptha):
-    personas = await naptha.hub.list_personas()
-    
-    if not personas:
+async def list_personas(naptha, page_size=LIST_PAGE_SIZE, use_cache=True, **filters):
+    registry = naptha.registry if use_cache else naptha.hub
+    headers = ["Name", "ID", "Version", "Author", "Description", "URL"]
+    fields = ["name", "id", "version", "author", "description", "url"]
+    total = 0
+
+    async for personas in registry.iter_personas(page_size=page_size, fields=fields, **filters):
+        table_data = []
+
+        for persona in personas:
+            # Wrap the description text
+            wrapped_description = '\n'.join(wrap(persona.get('description') or '', width=50))
+
+            row = [
+                persona.get('name'),
+                persona.get('id'),
+                persona.get('version'),
+                persona.get('author'),
+                wrapped_description,
+                persona.get('url')
+            ]
+            table_data.append(row)
+
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        total += len(personas)
+
+    if not total:
         print("No personas found.")
         return
-
-    headers = ["Name", "ID", "Version", "Author", "Description", "URL"]
-    table_data = []
-
-    for persona in personas:
-        # Wrap the description text
-        wrapped_description = '\n'.join(wrap(persona['description'], width=50))
-        
-        row = [
-            persona['name'],
-            persona['id'],
-            persona['version'],
-            persona['author'],
-            wrapped_description,
-            persona['url']
-        ]
-        table_data.append(row)
-
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
-    print(f"\nTotal personas: {len(personas)}")
+    print(f"\nTotal personas: {total}")
 
 async def create_agent(naptha, agent_config):
     print(f"Agent Config: {agent_config}")
     agent = await naptha.hub.create_agent(agent_config)
+    naptha.registry.invalidate("agent")
     if isinstance(agent, dict):
         print(f"Agent created: {agent}")
     elif isinstance(agent, list):
@@ -183,6 +212,7 @@ async def create_agent(naptha, agent_config):
 async def create_orchestrator(naptha, orchestrator_config):
     print(f"Orchestrator Config: {orchestrator_config}")
     orchestrator = await naptha.hub.create_orchestrator(orchestrator_config)
+    naptha.registry.invalidate("orchestrator")
     if isinstance(orchestrator, dict):
         print(f"Orchestrator created: {orchestrator}")
     elif isinstance(orchestrator, list):
@@ -191,6 +221,7 @@ async def create_orchestrator(naptha, orchestrator_config):
 async def create_environment(naptha, environment_config):
     print(f"Environment Config: {environment_config}")
     environment = await naptha.hub.create_environment(environment_config)
+    naptha.registry.invalidate("environment")
     if isinstance(environment, dict):
         print(f"Environment created: {environment}")
     elif isinstance(environment, list):
@@ -199,6 +230,7 @@ async def create_environment(naptha, environment_config):
 async def create_persona(naptha, persona_config):
     print(f"Persona Config: {persona_config}")
     persona = await naptha.hub.create_persona(persona_config)
+    naptha.registry.invalidate("persona")
     if isinstance(persona, dict):
         print(f"Persona created: {persona}")
     elif isinstance(persona, list):
@@ -213,6 +245,8 @@ async def create(
         environment_modules = None,
         environment_node_urls = None
 ):
+    from naptha_sdk.schemas import AgentDeployment, EnvironmentDeployment, OrchestratorDeployment
+
     if "orchestrator:" in module_name:
         module_type = "orchestrator"
     elif "agent:" in module_name:
@@ -222,14 +256,7 @@ async def create(
     else:
         module_type = "agent"
 
-    user = await naptha.node.check_user(user_input={"public_key": naptha.hub.public_key})
-
-    if user['is_registered']:
-        print("Found user...", user)
-    else:
-        print("No user found. Registering user...")
-        user = await naptha.node.register_user(user_input=user)
-        print(f"User registered: {user}.")
+    user = await naptha.node.check_and_register_user(naptha.hub.public_key)
 
     if agent_modules:
         aux_agent_deployments = []
@@ -294,8 +321,12 @@ async def run(
     worker_node_urls="http://localhost:7001",
     environment_node_urls=["http://localhost:7001"],
     yaml_file=None, 
-    personas_urls=None
+    personas_urls=None,
+    verbose=True
 ):   
+    from naptha_sdk.schemas import AgentConfig, AgentDeployment, EnvironmentDeployment, OrchestratorDeployment, \
+        OrchestratorRunInput, EnvironmentRunInput
+
     if yaml_file and parameters:
         raise ValueError("Cannot pass both yaml_file and parameters")
     
@@ -311,17 +342,11 @@ async def run(
     else:
         module_type = "agent" # Default to agent for backwards compatibility
 
-    user = await naptha.node.check_user(user_input={"public_key": naptha.hub.public_key})
-
-    if user['is_registered'] == True:
-        print("Found user...", user)
-    else:
-        print("No user found. Registering user...")
-        user = await naptha.node.register_user(user_input=user)
-        print(f"User registered: {user}.")
+    user = await naptha.node.check_and_register_user(naptha.hub.public_key)
 
     if module_type == "agent":
-        print("Running Agent...")
+        if verbose:
+            print("Running Agent...")
         agent_deployment = AgentDeployment(
             name=module_name, 
             module={"name": module_name}, 
@@ -335,12 +360,14 @@ async def run(
             "agent_deployment": agent_deployment.model_dump(),
             "personas_urls": personas_urls
         }
-        print(f"Agent run input: {agent_run_input}")
+        if verbose:
+            print(f"Agent run input: {agent_run_input}")
 
-        agent_run = await naptha.node.run_agent_and_poll(agent_run_input)
+        return await naptha.node.run_agent_and_poll(agent_run_input, verbose)
 
     elif module_type == "orchestrator":
-        print("Running Orchestrator...")
+        if verbose:
+            print("Running Orchestrator...")
         agent_deployments = []
         for worker_node_url in worker_node_urls:
             agent_deployments.append(AgentDeployment(worker_node_url=worker_node_url))
@@ -362,10 +389,11 @@ async def run(
             inputs=parameters,
             orchestrator_deployment=orchestrator_deployment
         )
-        orchestrator_run = await naptha.node.run_orchestrator_and_poll(orchestrator_run_input)
+        return await naptha.node.run_orchestrator_and_poll(orchestrator_run_input, verbose)
 
     elif module_type == "environment":
-        print("Running Environment...")
+        if verbose:
+            print("Running Environment...")
 
         environment_deployment = EnvironmentDeployment(
             name=module_name, 
@@ -378,8 +406,126 @@ async def run(
             environment_deployment=environment_deployment,
             consumer_id=user_id,
         )
-        environment_run = await naptha.node.run_environment_and_poll(environment_run_input)
-        
+        return await naptha.node.run_environment_and_poll(environment_run_input, verbose)
+
+def _input_ids(inputs):
+    """Stable ids for batch inputs: a hash of the input, plus how many identical inputs came before it."""
+    seen = {}
+    ids = []
+    for parameters in inputs:
+        digest = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(f"{digest}-{seen[digest]}")
+    return ids
+
+def _completed_ids(out_file):
+    """Ids of the inputs that already completed in a previous batch run writing to out_file."""
+    completed = set()
+    if not os.path.exists(out_file):
+        return completed
+    with open(out_file) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by an interrupted run
+            if result.get("status") == "completed":
+                completed.add(result["input_id"])
+    return completed
+
+def _percentile(sorted_values, percentile):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percentile))]
+
+async def run_batch(
+    naptha,
+    module_name,
+    user_id,
+    batch_file,
+    out_file=None,
+    concurrency=BATCH_CONCURRENCY,
+    worker_node_urls="http://localhost:7001",
+    environment_node_urls=["http://localhost:7001"],
+    personas_urls=None
+):
+    """Run a module once per line of a JSONL file of parameters, concurrency runs at a time.
+
+    Each result is appended to out_file as soon as its run finishes. Inputs that already have a
+    completed result in out_file are skipped, so an interrupted batch can be resumed by running it again.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    out_file = out_file or f"{os.path.splitext(batch_file)[0]}.results.jsonl"
+
+    with open(batch_file) as f:
+        inputs = [json.loads(line) for line in f if line.strip()]
+    completed = _completed_ids(out_file)
+    pending = [
+        (line, input_id, parameters)
+        for line, (input_id, parameters) in enumerate(zip(_input_ids(inputs), inputs), start=1)
+        if input_id not in completed
+    ]
+    skipped = len(inputs) - len(pending)
+    print(f"Running {len(pending)} of {len(inputs)} inputs with concurrency {concurrency}"
+          + (f" ({skipped} already completed in {out_file})" if skipped else ""))
+    if not pending:
+        return
+
+    # Make sure the user exists before the runs start, instead of every run racing to register it
+    await naptha.node.check_and_register_user(naptha.hub.public_key)
+
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    latencies = []
+    failed = 0
+    started = time.perf_counter()
+    live = sys.stderr.isatty()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        done = len(latencies)
+        ordered = sorted(latencies)
+        stats = (f"{done}/{len(pending)} done, {failed} failed, {done / elapsed:.2f} runs/s, "
+                 f"latency p50 {_percentile(ordered, 0.5):.1f}s p95 {_percentile(ordered, 0.95):.1f}s")
+        if live and not final:
+            sys.stderr.write(f"\r{stats}")
+            sys.stderr.flush()
+        elif final or (done < len(pending) and done % max(1, len(pending) // 20) == 0):
+            print(("\n" if live else "") + stats, file=sys.stderr)
+
+    async def worker(out):
+        nonlocal failed
+        while not queue.empty():
+            line, input_id, parameters = queue.get_nowait()
+            run_started = time.perf_counter()
+            result = {"input_id": input_id, "line": line, "inputs": parameters}
+            try:
+                module_run = await run(naptha, module_name, user_id, parameters, worker_node_urls,
+                                       environment_node_urls, personas_urls=personas_urls, verbose=False)
+                result.update(status=module_run.status, results=module_run.results,
+                              error_message=module_run.error_message)
+            except Exception as e:
+                result.update(status="error", results=[], error_message=f"{type(e).__name__}: {e}")
+            result["latency"] = round(time.perf_counter() - run_started, 3)
+            if result["status"] != "completed":
+                failed += 1
+            out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+            latencies.append(result["latency"])
+            report()
+
+    # Keep per-run debug logs from the node client out of the live stats
+    node_logger = logging.getLogger("naptha_sdk.client.node")
+    node_log_level = node_logger.level
+    node_logger.setLevel(max(node_log_level, logging.INFO))
+    try:
+        with open(out_file, "a") as out:
+            await asyncio.gather(*(worker(out) for _ in range(min(concurrency, len(pending)))))
+    finally:
+        node_logger.setLevel(node_log_level)
+    report(final=True)
+    print(f"Results written to {out_file}")
+
 async def read_storage(naptha, hash_or_name, output_dir='./files', ipfs=False):
     """Read from storage, IPFS, or IPNS."""
     try:
@@ -403,6 +549,37 @@ def _parse_list_arg(args, arg_name, default=None, split_char=','):
         return value.split(split_char) if split_char in value else [value]
     return default
 
+def _positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not an integer")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} must be a positive integer")
+    return number
+
+def _add_list_args(parser, filters=True):
+    """Add paging and filter arguments shared by the hub listing commands."""
+    parser.add_argument("--page_size", type=_positive_int, default=LIST_PAGE_SIZE, help="Number of records to fetch per page")
+    parser.add_argument("--refresh", action="store_true", help="Sync the local registry cache with the hub before listing")
+    parser.add_argument("--no_cache", action="store_true", help="List directly from the hub instead of the local registry cache")
+    if filters:
+        parser.add_argument("--author", help="Only list modules by this author")
+        parser.add_argument("--module_type", help="Only list modules of this type")
+        parser.add_argument("--module_version", help="Only list modules with this version")
+
+async def _use_registry_cache(naptha, args, table):
+    """Decide whether to list from the local registry cache, syncing it first if asked to."""
+    if args.no_cache:
+        return False
+    if args.refresh:
+        await naptha.registry.refresh(table)
+    return True
+
+def _list_filters(args):
+    return {"author": args.author, "type": args.module_type, "version": args.module_version}
+
 def _parse_str_args(args):
     # Parse all list arguments
     args.worker_node_urls = _parse_list_arg(args, 'worker_node_urls', default=["http://localhost:7001"])
@@ -410,45 +587,44 @@ def _parse_str_args(args):
     args.agent_modules = _parse_list_arg(args, 'agent_modules', default=None)
     args.environment_modules = _parse_list_arg(args, 'environment_modules', default=None)
     args.personas_urls = _parse_list_arg(args, 'personas_urls', default=None)
+    args.agents = _parse_list_arg(args, 'agents', default=None)
     return args
 
-async def main():
-    public_key = get_public_key(os.getenv("PRIVATE_KEY")) if os.getenv("PRIVATE_KEY") else None
-    hub_username = os.getenv("HUB_USERNAME")
-    hub_password = os.getenv("HUB_PASSWORD")
-    hub_url = os.getenv("HUB_URL")
-
-    naptha = Naptha()
-
+def build_parser():
     parser = argparse.ArgumentParser(description="CLI with for Naptha")
     subparsers = parser.add_subparsers(title="commands", dest="command")
 
     # Node commands
     nodes_parser = subparsers.add_parser("nodes", help="List available nodes.")
+    _add_list_args(nodes_parser, filters=False)
 
     # Agent commands
     agents_parser = subparsers.add_parser("agents", help="List available agents.")
     agents_parser.add_argument('agent_name', nargs='?', help='Optional agent name')
     agents_parser.add_argument("-p", '--metadata', type=str, help='Metadata in "key=value" format')
     agents_parser.add_argument('-d', '--delete', action='store_true', help='Delete a agent')
+    _add_list_args(agents_parser, filters=True)
 
     # Orchestrator commands
     orchestrators_parser = subparsers.add_parser("orchestrators", help="List available orchestrators.")
     orchestrators_parser.add_argument('orchestrator_name', nargs='?', help='Optional orchestrator name')
     orchestrators_parser.add_argument("-p", '--metadata', type=str, help='Metadata in "key=value" format')
     orchestrators_parser.add_argument('-d', '--delete', action='store_true', help='Delete an orchestrator')
+    _add_list_args(orchestrators_parser, filters=True)
 
     # Environment commands
     environments_parser = subparsers.add_parser("environments", help="List available environments.")
     environments_parser.add_argument('environment_name', nargs='?', help='Optional environment name')
     environments_parser.add_argument("-p", '--metadata', type=str, help='Metadata in "key=value" format')
     environments_parser.add_argument('-d', '--delete', action='store_true', help='Delete an environment')
+    _add_list_args(environments_parser, filters=True)
 
     # Persona commands
     personas_parser = subparsers.add_parser("personas", help="List available personas.")
     personas_parser.add_argument('persona_name', nargs='?', help='Optional persona name')
     personas_parser.add_argument("-p", '--metadata', type=str, help='Metadata in "key=value" format')
     personas_parser.add_argument('-d', '--delete', action='store_true', help='Delete a persona')
+    _add_list_args(personas_parser, filters=True)
 
     # Create command
     create_parser = subparsers.add_parser("create", help="Execute create command.")
@@ -466,6 +642,9 @@ async def main():
     run_parser.add_argument("-e", "--environment_node_urls", help="Environment nodes to store data during agent runs.")
     run_parser.add_argument("-u", "--personas_urls", help="Personas URLs to install before running the agent")
     run_parser.add_argument("-f", "--file", help="YAML file with agent run parameters")
+    run_parser.add_argument("-b", "--batch", help="JSONL file with one set of run parameters per line")
+    run_parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY, help="Number of batch runs in flight at once")
+    run_parser.add_argument("-o", "--out", help="JSONL file to append batch results to (default: <batch>.results.jsonl)")
 
     # Inference command
     inference_parser = subparsers.add_parser("inference", help="Run model inference.")
@@ -491,175 +670,232 @@ async def main():
 
     # Publish command
     publish_parser = subparsers.add_parser("publish", help="Publish agents.")
+    publish_parser.add_argument("--force", action="store_true", help="Publish all agents, including ones unchanged since their last publish")
+
+    # Build command
+    build_parser = subparsers.add_parser("build", help="Package agents declared with @agent in a Python file.")
+    build_parser.add_argument("file", help="Python file that declares the agents")
+    build_parser.add_argument("-a", "--agents", help="Comma-separated names of the agents to build (default: all)")
+    build_parser.add_argument("--no_register", action="store_true", help="Only write the packages, without registering them with the hub")
+
+    # Daemon command
+    daemon_parser = subparsers.add_parser("daemon", help="Run a background daemon that keeps hub and node connections warm.")
+    daemon_parser.add_argument("action", choices=["start", "stop", "status"], help="Start the daemon in the foreground, stop it or show its status")
+
+    return parser
+
+def parse_args(argv=None):
+    return _parse_str_args(build_parser().parse_args(argv))
+
+async def dispatch(naptha, args):
+    """Run a parsed CLI command with a connected Naptha client."""
+    public_key = get_public_key(os.getenv("PRIVATE_KEY")) if os.getenv("PRIVATE_KEY") else None
+    hub_username = os.getenv("HUB_USERNAME")
+    hub_password = os.getenv("HUB_PASSWORD")
+    hub_url = os.getenv("HUB_URL")
+
+    if args.command == "signup":
+        _, user_id = await user_setup_flow(hub_url, public_key)
+    elif args.command == "build" and args.no_register:
+        load_agent_module(args.file)
+        await naptha.build_agents(args.agents, register=False)
+    elif args.command in ["nodes", "agents", "orchestrators", "environments", "personas", "run", "inference", "read_storage", "write_storage", "publish", "create", "build"]:
+        user_id = naptha.hub.user_id
+        if not naptha.hub.is_authenticated:
+            if not hub_username or not hub_password:
+                print(
+                    "Please set HUB_USERNAME and HUB_PASSWORD environment variables or sign up first (run naptha signup).")
+                return
+            _, _, user_id = await naptha.hub.signin(hub_username, hub_password)
+
+        if args.command == "nodes":
+            await list_nodes(naptha, args.page_size, await _use_registry_cache(naptha, args, "node"))
+        elif args.command == "agents":
+            if not args.agent_name:
+                await list_agents(naptha, args.page_size, await _use_registry_cache(naptha, args, "agent"), **_list_filters(args))
+            elif args.delete and len(args.agent_name.split()) == 1:
+                await naptha.hub.delete_agent(args.agent_name)
+                naptha.registry.invalidate("agent")
+            elif len(args.agent_name.split()) == 1:
+                if hasattr(args, 'metadata') and args.metadata is not None:
+                    params = shlex.split(args.metadata)
+                    parsed_params = {}
+                    for param in params:
+                        key, value = param.split('=')
+                        parsed_params[key] = value
+
+                    required_metadata = ['description', 'parameters', 'url', 'type', 'version']
+                    missing_metadata = [param for param in required_metadata if param not in parsed_params]
+                    if missing_metadata:
+                        print(f"Missing required metadata: {', '.join(missing_metadata)}")
+                        return
+                        
+                    agent_config = {
+                        "id": f"agent:{args.agent_name}",
+                        "name": args.agent_name,
+                        "description": parsed_params['description'],
+                        "parameters": parsed_params['parameters'],
+                        "author": naptha.hub.user_id,
+                        "url": parsed_params['url'],
+                        "type": parsed_params['type'],
+                        "version": parsed_params['version'],
+                    }
+                    await create_agent(naptha, agent_config)
+            else:
+                print("Invalid command.")
+        elif args.command == "orchestrators":
+            if not args.orchestrator_name:
+                await list_orchestrators(naptha, args.page_size, await _use_registry_cache(naptha, args, "orchestrator"), **_list_filters(args))
+            elif args.delete and len(args.orchestrator_name.split()) == 1:
+                await naptha.hub.delete_orchestrator(args.orchestrator_name)
+                naptha.registry.invalidate("orchestrator")
+            elif len(args.orchestrator_name.split()) == 1:
+                if hasattr(args, 'metadata') and args.metadata is not None:
+                    params = shlex.split(args.metadata)
+                    parsed_params = {}
+                    for param in params:
+                        key, value = param.split('=')
+                        parsed_params[key] = value
+
+                    required_metadata = ['description', 'parameters', 'url', 'type', 'version']
+                    if not all(param in parsed_params for param in required_metadata):
+                        print(f"Missing one or more of the following required metadata: {required_metadata}")
+                        return
+                        
+                    orchestrator_config = {
+                        "id": f"orchestrator:{args.orchestrator_name}",
+                        "name": args.orchestrator_name,
+                        "description": parsed_params['description'],
+                        "parameters": parsed_params['parameters'],
+                        "author": naptha.hub.user_id,
+                        "url": parsed_params['url'],
+                        "type": parsed_params['type'],
+                        "version": parsed_params['version'],
+                    }
+                    await create_orchestrator(naptha, orchestrator_config)
+            else:
+                print("Invalid command.")
+        elif args.command == "environments":
+            if not args.environment_name:
+                await list_environments(naptha, args.page_size, await _use_registry_cache(naptha, args, "environment"), **_list_filters(args))
+            elif args.delete and len(args.environment_name.split()) == 1:
+                await naptha.hub.delete_environment(args.environment_name)
+                naptha.registry.invalidate("environment")
+            elif len(args.environment_name.split()) == 1:
+                if hasattr(args, 'metadata') and args.metadata is not None:
+                    params = shlex.split(args.metadata)
+                    parsed_params = {}
+                    for param in params:
+                        key, value = param.split('=')
+                        parsed_params[key] = value
+
+                    required_metadata = ['description', 'parameters', 'url', 'type', 'version']
+                    if not all(param in parsed_params for param in required_metadata):
+                        print(f"Missing one or more of the following required metadata: {required_metadata}")
+                        return
+                        
+                    environment_config = {
+                        "id": f"environment:{args.environment_name}",
+                        "name": args.environment_name,
+                        "description": parsed_params['description'],
+                        "parameters": parsed_params['parameters'],
+                        "author": naptha.hub.user_id,
+                        "url": parsed_params['url'],
+                        "type": parsed_params['type'],
+                        "version": parsed_params['version'],
+                    }
+                    await create_environment(naptha, environment_config)
+            else:
+                print("Invalid command.")
+        elif args.command == "personas":
+            if not args.persona_name:
+                await list_personas(naptha, args.page_size, await _use_registry_cache(naptha, args, "persona"), **_list_filters(args))
+            elif args.delete and len(args.persona_name.split()) == 1:
+                await naptha.hub.delete_persona(args.persona_name)
+                naptha.registry.invalidate("persona")
+            elif len(args.persona_name.split()) == 1:
+                if hasattr(args, 'metadata') and args.metadata is not None:
+                    params = shlex.split(args.metadata)
+                    parsed_params = {}
+                    for param in params:
+                        key, value = param.split('=')
+                        parsed_params[key] = value
+
+                    required_metadata = ['description', 'parameters', 'url', 'type', 'version']
+                    if not all(param in parsed_params for param in required_metadata):
+                        print(f"Missing one or more of the following required metadata: {required_metadata}")
+                        return
+                        
+                    persona_config = {
+                        "id": f"persona:{args.persona_name}",
+                        "name": args.persona_name,
+                        "description": parsed_params['description'],
+                        "author": naptha.hub.user_id,
+                        "url": parsed_params['url'],
+                        "version": parsed_params['version'],
+                    }
+                    await create_persona(naptha, persona_config)
+            else:
+                print("Invalid command.")
+        elif args.command == "create":
+            await create(naptha, args.module, args.agent_modules, args.worker_node_urls, args.environment_modules, args.environment_node_urls)
+        elif args.command == "run" and args.batch:
+            if args.parameters or args.file:
+                raise ValueError("Cannot pass --batch with --parameters or --file")
+            await run_batch(naptha, args.agent, user_id, args.batch, args.out, args.concurrency,
+                            args.worker_node_urls, args.environment_node_urls, args.personas_urls)
+        elif args.command == "run":
+            if hasattr(args, 'parameters') and args.parameters is not None:
+                try:
+                    parsed_params = json.loads(args.parameters)
+                except json.JSONDecodeError:
+                    params = shlex.split(args.parameters)
+                    parsed_params = {}
+                    for param in params:
+                        key, value = param.split('=')
+                        parsed_params[key] = value
+            else:
+                parsed_params = None
+                
+            await run(naptha, args.agent, user_id, parsed_params, args.worker_node_urls, args.environment_node_urls, args.file, args.personas_urls)
+        elif args.command == "inference":
+            from naptha_sdk.schemas import ChatCompletionRequest
+            request = ChatCompletionRequest(
+                messages=[{"role": "user", "content": args.prompt}],
+                model=args.model,
+            )
+            await naptha.node.run_inference(request)
+        elif args.command == "read_storage":
+            await read_storage(naptha, args.agent_run_id, args.output_dir, args.ipfs)
+        elif args.command == "write_storage":
+            await write_storage(naptha, args.storage_input, args.ipfs, args.publish_to_ipns, args.update_ipns_name)
+        elif args.command == "publish":
+            await naptha.publish_agents(force=args.force)
+        elif args.command == "build":
+            load_agent_module(args.file)
+            await naptha.build_agents(args.agents)
+
+async def main():
+    parser = build_parser()
+    args = _parse_str_args(parser.parse_args())
+    if args.command is None:
+        parser.print_help()
+        return
+    if args.command == "daemon":
+        await daemon_command(args.action)
+        return
+
+    # Hand the command to a running daemon, if there is one, instead of connecting from scratch
+    if args.command in DAEMON_COMMANDS and not os.getenv("NAPTHA_NO_DAEMON"):
+        exit_code = await send_command(sys.argv[1:])
+        if exit_code is not None:
+            if exit_code:
+                sys.exit(exit_code)
+            return
 
+    naptha = Naptha()
     async with naptha as naptha:
-        args = parser.parse_args()
-        args = _parse_str_args(args)
-        if args.command == "signup":
-            _, user_id = await user_setup_flow(hub_url, public_key)
-        elif args.command in ["nodes", "agents", "orchestrators", "environments", "personas", "run", "inference", "read_storage", "write_storage", "publish", "create"]:
-            if not naptha.hub.is_authenticated:
-                if not hub_username or not hub_password:
-                    print(
-                        "Please set HUB_USERNAME and HUB_PASSWORD environment variables or sign up first (run naptha signup).")
-                    return
-                _, _, user_id = await naptha.hub.signin(hub_username, hub_password)
-
-            if args.command == "nodes":
-                await list_nodes(naptha)   
-            elif args.command == "agents":
-                if not args.agent_name:
-                    await list_agents(naptha)
-                elif args.delete and len(args.agent_name.split()) == 1:
-                    await naptha.hub.delete_agent(args.agent_name)
-                elif len(args.agent_name.split()) == 1:
-                    if hasattr(args, 'metadata') and args.metadata is not None:
-                        params = shlex.split(args.metadata)
-                        parsed_params = {}
-                        for param in params:
-                            key, value = param.split('=')
-                            parsed_params[key] = value
-
-                        required_metadata = ['description', 'parameters', 'url', 'type', 'version']
-                        missing_metadata = [param for param in required_metadata if param not in parsed_params]
-                        if missing_metadata:
-                            print(f"Missing required metadata: {', '.join(missing_metadata)}")
-                            return
-                            
-                        agent_config = {
-                            "id": f"agent:{args.agent_name}",
-                            "name": args.agent_name,
-                            "description": parsed_params['description'],
-                            "parameters": parsed_params['parameters'],
-                            "author": naptha.hub.user_id,
-                            "url": parsed_params['url'],
-                            "type": parsed_params['type'],
-                            "version": parsed_params['version'],
-                        }
-                        await create_agent(naptha, agent_config)
-                else:
-                    print("Invalid command.")
-            elif args.command == "orchestrators":
-                if not args.orchestrator_name:
-                    await list_orchestrators(naptha)
-                elif args.delete and len(args.orchestrator_name.split()) == 1:
-                    await naptha.hub.delete_orchestrator(args.orchestrator_name)
-                elif len(args.orchestrator_name.split()) == 1:
-                    if hasattr(args, 'metadata') and args.metadata is not None:
-                        params = shlex.split(args.metadata)
-                        parsed_params = {}
-                        for param in params:
-                            key, value = param.split('=')
-                            parsed_params[key] = value
-
-                        required_metadata = ['description', 'parameters', 'url', 'type', 'version']
-                        if not all(param in parsed_params for param in required_metadata):
-                            print(f"Missing one or more of the following required metadata: {required_metadata}")
-                            return
-                            
-                        orchestrator_config = {
-                            "id": f"orchestrator:{args.orchestrator_name}",
-                            "name": args.orchestrator_name,
-                            "description": parsed_params['description'],
-                            "parameters": parsed_params['parameters'],
-                            "author": naptha.hub.user_id,
-                            "url": parsed_params['url'],
-                            "type": parsed_params['type'],
-                            "version": parsed_params['version'],
-                        }
-                        await create_orchestrator(naptha, orchestrator_config)
-                else:
-                    print("Invalid command.")
-            elif args.command == "environments":
-                if not args.environment_name:
-                    await list_environments(naptha)
-                elif args.delete and len(args.environment_name.split()) == 1:
-                    await naptha.hub.delete_environment(args.environment_name)
-                elif len(args.environment_name.split()) == 1:
-                    if hasattr(args, 'metadata') and args.metadata is not None:
-                        params = shlex.split(args.metadata)
-                        parsed_params = {}
-                        for param in params:
-                            key, value = param.split('=')
-                            parsed_params[key] = value
-
-                        required_metadata = ['description', 'parameters', 'url', 'type', 'version']
-                        if not all(param in parsed_params for param in required_metadata):
-                            print(f"Missing one or more of the following required metadata: {required_metadata}")
-                            return
-                            
-                        environment_config = {
-                            "id": f"environment:{args.environment_name}",
-                            "name": args.environment_name,
-                            "description": parsed_params['description'],
-                            "parameters": parsed_params['parameters'],
-                            "author": naptha.hub.user_id,
-                            "url": parsed_params['url'],
-                            "type": parsed_params['type'],
-                            "version": parsed_params['version'],
-                        }
-                        await create_environment(naptha, environment_config)
-                else:
-                    print("Invalid command.")
-            elif args.command == "personas":
-                if not args.persona_name:
-                    await list_personas(naptha)
-                elif args.delete and len(args.persona_name.split()) == 1:
-                    await naptha.hub.delete_persona(args.persona_name)
-                elif len(args.persona_name.split()) == 1:
-                    if hasattr(args, 'metadata') and args.metadata is not None:
-                        params = shlex.split(args.metadata)
-                        parsed_params = {}
-                        for param in params:
-                            key, value = param.split('=')
-                            parsed_params[key] = value
-
-                        required_metadata = ['description', 'parameters', 'url', 'type', 'version']
-                        if not all(param in parsed_params for param in required_metadata):
-                            print(f"Missing one or more of the following required metadata: {required_metadata}")
-                            return
-                            
-                        persona_config = {
-                            "id": f"persona:{args.persona_name}",
-                            "name": args.persona_name,
-                            "description": parsed_params['description'],
-                            "author": naptha.hub.user_id,
-                            "url": parsed_params['url'],
-                            "version": parsed_params['version'],
-                        }
-                        await create_persona(naptha, persona_config)
-                else:
-                    print("Invalid command.")
-            elif args.command == "create":
-                await create(naptha, args.module, args.agent_modules, args.worker_node_urls, args.environment_modules, args.environment_node_urls)
-            elif args.command == "run":
-                if hasattr(args, 'parameters') and args.parameters is not None:
-                    try:
-                        parsed_params = json.loads(args.parameters)
-                    except json.JSONDecodeError:
-                        params = shlex.split(args.parameters)
-                        parsed_params = {}
-                        for param in params:
-                            key, value = param.split('=')
-                            parsed_params[key] = value
-                else:
-                    parsed_params = None
-                    
-                await run(naptha, args.agent, user_id, parsed_params, args.worker_node_urls, args.environment_node_urls, args.file, args.personas_urls)
-            elif args.command == "inference":
-                request = ChatCompletionRequest(
-                    messages=[{"role": "user", "content": args.prompt}],
-                    model=args.model,
-                )
-                await naptha.node.run_inference(request)
-            elif args.command == "read_storage":
-                await read_storage(naptha, args.agent_run_id, args.output_dir, args.ipfs)
-            elif args.command == "write_storage":
-                await write_storage(naptha, args.storage_input, args.ipfs, args.publish_to_ipns, args.update_ipns_name)
-            elif args.command == "publish":
-                await naptha.publish_agents()
-        else:
-            parser.print_help()
+        await dispatch(naptha, args)
 
 def cli():
     asyncio.run(main())
@@ -0,0 +1,92 @@
+import json
+import os
+from typing import Any, Optional, Type, Union
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Codec for the request bodies and websocket messages sent to nodes: "json", or "msgpack" for
+# nodes that accept MessagePack. Responses are decoded according to their content type either way.
+NODE_CODEC = os.getenv("NAPTHA_NODE_CODEC", "json")
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class JsonCodec:
+    """JSON, encoded and decoded with orjson when it is installed.
+
+    Models are serialized and validated by pydantic directly to and from bytes, without an
+    intermediate dict or str.
+    """
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+    accept = JSON_CONTENT_TYPE
+
+    def encode(self, obj: Any) -> bytes:
+        if isinstance(obj, BaseModel):
+            return obj.model_dump_json().encode()
+        if orjson is not None:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj).encode()
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def decode_model(self, data: Union[bytes, str], model_class: Type[BaseModel]) -> BaseModel:
+        return model_class.model_validate_json(data)
+
+
+class MsgpackCodec:
+    """MessagePack, for nodes that support it. Responses in JSON are still accepted."""
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+    accept = f"{MSGPACK_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.9"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack codec needs the msgpack package: pip install msgpack")
+
+    def encode(self, obj: Any) -> bytes:
+        if isinstance(obj, BaseModel):
+            obj = obj.model_dump(mode="json")
+        return msgpack.packb(obj)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+    def decode_model(self, data: bytes, model_class: Type[BaseModel]) -> BaseModel:
+        return model_class.model_validate(self.decode(data))
+
+
+CODECS = {
+    "json": JsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+_json_codec = JsonCodec()
+
+
+def get_codec(name: Optional[str] = None):
+    name = name or NODE_CODEC
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name!r}. Available codecs: {', '.join(CODECS)}")
+    return CODECS[name]()
+
+
+def codec_for_content_type(content_type: Optional[str], codec=None):
+    """The codec to decode a body of the given content type with, reusing codec if it is of that kind."""
+    if content_type and MSGPACK_CONTENT_TYPE in content_type:
+        return codec if isinstance(codec, MsgpackCodec) else MsgpackCodec()
+    return codec if isinstance(codec, JsonCodec) else _json_codec
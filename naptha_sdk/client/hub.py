@@ -2,19 +2,30 @@ import os
 from naptha_sdk.utils import add_credentials_to_env, get_logger, write_private_key_to_file
 from naptha_sdk.user import generate_keypair
 from naptha_sdk.user import get_public_key, is_hex
-from surrealdb import Surreal
+import hashlib
+import json
+import re
+import time
 import traceback
-from typing import Dict, List, Optional, Tuple
-
-import jwt
-from surrealdb import Surreal
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+from naptha_sdk.cache import FileCache
 from naptha_sdk.user import generate_keypair
 from naptha_sdk.user import get_public_key
 from naptha_sdk.utils import add_credentials_to_env, get_logger
 
 logger = get_logger(__name__)
 
+# Refresh cached tokens this many seconds before they actually expire
+TOKEN_EXPIRY_MARGIN = 60
+
+_token_cache = FileCache("hub_tokens", secure=True)
+
+LIST_PAGE_SIZE = 100
+UPSERT_BATCH_SIZE = 500
+MODULE_TABLES = ("agent", "orchestrator", "environment", "persona")
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+
 
 class Hub:
     """The Hub class is the entry point into Naptha AI Hub."""
@@ -24,13 +35,21 @@ class Hub:
         self.public_key = public_key
         self.ns = "naptha"
         self.db = "naptha"
-        self.surrealdb = Surreal(hub_url)
+        self._surrealdb = None
         self.is_authenticated = False
         self.user_id = None
         self.token = None
         
         logger.info(f"Hub URL: {hub_url}")
 
+    @property
+    def surrealdb(self):
+        # surrealdb pulls in httpx and websockets, so it is only imported once the hub is used
+        if self._surrealdb is None:
+            from surrealdb import Surreal
+            self._surrealdb = Surreal(self.hub_url)
+        return self._surrealdb
+
     async def connect(self):
         """Connect to the database and authenticate"""
         if not self.is_authenticated:
@@ -42,9 +61,45 @@ class Hub:
                 raise
 
     def _decode_token(self, token: str) -> str:
+        import jwt
         return jwt.decode(token, options={"verify_signature": False})["ID"]
 
-    async def signin(self, username: str, password: str) -> Tuple[bool, Optional[str], Optional[str]]:
+    def _token_cache_key(self, username: str, password: str) -> str:
+        password_hash = hashlib.sha256(f"{self.hub_url}:{username}:{password}".encode()).hexdigest()
+        return json.dumps([self.hub_url, self.ns, self.db, username, password_hash])
+
+    def _cache_token(self, username: str, password: str, token: str):
+        """Cache a session token on disk until shortly before it expires."""
+        import jwt
+        try:
+            expires_at = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.PyJWTError:
+            return
+        if not expires_at or expires_at - TOKEN_EXPIRY_MARGIN <= time.time():
+            return
+        _token_cache.set(self._token_cache_key(username, password), token, expires_at=expires_at - TOKEN_EXPIRY_MARGIN)
+
+    async def authenticate(self, token: str) -> bool:
+        """Authenticate the connection with an existing session token instead of signing in."""
+        try:
+            await self.surrealdb.authenticate(token)
+        except Exception as e:
+            logger.info(f"Token authentication failed: {e}")
+            return False
+        self.user_id = self._decode_token(token)
+        self.token = token
+        self.is_authenticated = True
+        return True
+
+    async def signin(self, username: str, password: str, use_cache: bool = True) -> Tuple[bool, Optional[str], Optional[str]]:
+        if use_cache:
+            cache_key = self._token_cache_key(username, password)
+            token = _token_cache.get(cache_key)
+            if token:
+                if await self.authenticate(token):
+                    logger.info(f"Signed in to hub with cached session token. User ID: {self.user_id}")
+                    return True, token, self.user_id
+                _token_cache.delete(cache_key)
         try:
             print("Signing in to hub with username: ", username)
             user = await self.surrealdb.signin(
@@ -59,6 +114,7 @@ class Hub:
             self.user_id = self._decode_token(user)
             self.token = user
             self.is_authenticated = True
+            self._cache_token(username, password, user)
             print("User ID: ", self.user_id)
             return True, user, self.user_id
         except Exception as e:
@@ -80,6 +136,7 @@ class Hub:
         if not user:
             return False, None, None
         self.user_id = self._decode_token(user)
+        self._cache_token(username, password, user)
         return True, user, self.user_id
 
 
@@ -114,41 +171,124 @@ class Hub:
     async def get_node(self, node_id: str) -> Optional[Dict]:
         return await self.surrealdb.select(node_id)
 
-    async def list_nodes(self) -> List:
-        nodes = await self.surrealdb.query("SELECT * FROM node;")
-        return nodes[0]['result']
-
-    async def list_agents(self, agent_name=None) -> List:
-        if not agent_name:
-            agents = await self.surrealdb.query("SELECT * FROM agent;")
-            return agents[0]['result']
+    def _build_list_query(
+        self,
+        table: str,
+        record_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        start: Optional[int] = None,
+        **filters
+    ) -> Tuple[str, Dict]:
+        """Build a SELECT over a hub table with optional projection, filters and paging."""
+        for field in list(fields or []) + list(filters):
+            if not FIELD_NAME_PATTERN.match(field):
+                raise ValueError(f"Invalid field name: {field}")
+
+        projection = ", ".join(fields) if fields else "*"
+        conditions, params = [], {}
+        if record_id:
+            conditions.append("id = $record_id")
+            params["record_id"] = record_id
+        for i, (field, value) in enumerate(filters.items()):
+            if value is None:
+                continue
+            conditions.append(f"{field} = $filter_{i}")
+            params[f"filter_{i}"] = value
+
+        query = f"SELECT {projection} FROM {table}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if limit is not None or start is not None:
+            query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT $limit"
+            params["limit"] = limit
+        if start is not None:
+            query += " START $start"
+            params["start"] = start
+        return query + ";", params
+
+    async def _list_table(self, table: str, record_id: Optional[str] = None, fields: Optional[List[str]] = None,
+                          limit: Optional[int] = None, start: Optional[int] = None, **filters) -> List:
+        query, params = self._build_list_query(table, record_id, fields, limit, start, **filters)
+        result = await self.surrealdb.query(query, params)
+        return result[0]['result']
+
+    async def _iter_table(self, table: str, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None,
+                          **filters) -> AsyncIterator[List]:
+        """Yield pages of records from a hub table until it is exhausted."""
+        if page_size < 1:
+            raise ValueError(f"page_size must be a positive integer, got {page_size}")
+        start = 0
+        while True:
+            page = await self._list_table(table, fields=fields, limit=page_size, start=start, **filters)
+            if page:
+                yield page
+            if len(page) < page_size:
+                break
+            start += page_size
+
+    async def list_nodes(self, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                         start: Optional[int] = None, **filters) -> List:
+        return await self._list_table("node", fields=fields, limit=limit, start=start, **filters)
+
+    async def list_agents(self, agent_name=None, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                          start: Optional[int] = None, **filters) -> List:
+        """List agents, optionally projected to fields and filtered by exact field values (e.g. author, type, version)."""
+        return await self._list_table("agent", agent_name, fields, limit, start, **filters)
+
+    async def list_orchestrators(self, orchestrator_name=None, fields: Optional[List[str]] = None,
+                                 limit: Optional[int] = None, start: Optional[int] = None, **filters) -> List:
+        return await self._list_table("orchestrator", orchestrator_name, fields, limit, start, **filters)
+
+    async def list_environments(self, environment_name=None, fields: Optional[List[str]] = None,
+                                limit: Optional[int] = None, start: Optional[int] = None, **filters) -> List:
+        return await self._list_table("environment", environment_name, fields, limit, start, **filters)
+
+    async def list_personas(self, persona_name=None, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                            start: Optional[int] = None, **filters) -> List:
+        return await self._list_table("persona", persona_name, fields, limit, start, **filters)
+
+    async def list_record_ids(self, table: str) -> List[str]:
+        """List only the ids of the records in a hub table."""
+        result = await self.surrealdb.query(f"SELECT id FROM {self._validate_table(table)};")
+        return [record['id'] for record in result[0]['result']]
+
+    async def list_updated_since(self, table: str, since: Optional[str] = None) -> List:
+        """List records changed after the given updated_at timestamp.
+
+        Records without an updated_at field are always returned, since there is no way to tell if they changed.
+        """
+        table = self._validate_table(table)
+        if not since:
+            result = await self.surrealdb.query(f"SELECT * FROM {table};")
         else:
-            agent = await self.surrealdb.query("SELECT * FROM agent WHERE id=$agent_name;", {"agent_name": agent_name})
-            return agent[0]['result']
+            result = await self.surrealdb.query(
+                f"SELECT * FROM {table} WHERE updated_at = NONE OR updated_at > <datetime>$since;",
+                {"since": since}
+            )
+        return result[0]['result']
 
-    async def list_orchestrators(self, orchestrator_name=None) -> List:
-        if not orchestrator_name:
-            orchestrators = await self.surrealdb.query("SELECT * FROM orchestrator;")
-            return orchestrators[0]['result']
-        else:
-            orchestrator = await self.surrealdb.query("SELECT * FROM orchestrator WHERE id=$orchestrator_name;", {"orchestrator_name": orchestrator_name})
-            return orchestrator[0]['result']
+    def _validate_table(self, table: str) -> str:
+        if not FIELD_NAME_PATTERN.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+        return table
 
-    async def list_environments(self, environment_name=None) -> List:
-        if not environment_name:
-            environments = await self.surrealdb.query("SELECT * FROM environment;")
-            return environments[0]['result']
-        else:
-            environment = await self.surrealdb.query("SELECT * FROM environment WHERE id=$environment_name;", {"environment_name": environment_name})
-            return environment[0]['result']
+    def iter_nodes(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("node", page_size, fields, **filters)
 
-    async def list_personas(self, persona_name=None) -> List:
-        if not persona_name:
-            personas = await self.surrealdb.query("SELECT * FROM persona;")
-            return personas[0]['result']
-        else:
-            persona = await self.surrealdb.query("SELECT * FROM persona WHERE id=$persona_name;", {"persona_name": persona_name})
-            return persona[0]['result']
+    def iter_agents(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("agent", page_size, fields, **filters)
+
+    def iter_orchestrators(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("orchestrator", page_size, fields, **filters)
+
+    def iter_environments(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("environment", page_size, fields, **filters)
+
+    def iter_personas(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("persona", page_size, fields, **filters)
 
     async def delete_agent(self, agent_id: str) -> Tuple[bool, Optional[Dict]]:
         if ":" not in agent_id:
@@ -222,11 +362,53 @@ class Hub:
         return await self.surrealdb.update("agent", agent_config)
 
     async def create_or_update_agent(self, agent_config: Dict) -> Tuple[bool, Optional[Dict]]:
-        list_agents = await self.list_agents(agent_config.get('id'))
-        if not list_agents:
-            return await self.surrealdb.create("agent", agent_config)
-        else:
-            return await self.surrealdb.update(agent_config.pop('id'), agent_config)
+        agent_id = agent_config.get('id')
+        if agent_id and ":" not in agent_id:
+            agent_config['id'] = f"agent:{agent_id}"
+        outcome = (await self.upsert_modules([agent_config]))[0]
+        return outcome['result'] if outcome['success'] else None
+
+    async def upsert_modules(self, module_configs: List[Dict], atomic: bool = True,
+                             batch_size: int = UPSERT_BATCH_SIZE) -> List[Dict]:
+        """Create or update many agent, orchestrator, environment and persona records at once.
+
+        Each config must have an id of the form "<table>:<name>". Records are sent as
+        UPDATE ... CONTENT statements, which create or replace the record on the SurrealDB 1.x
+        servers the pinned client targets (UPSERT only exists from 2.0), in batches of
+        batch_size, each batch in a single query. With atomic=True each
+        batch runs in one transaction, so a failed record rolls back the rest of its batch.
+
+        Returns one outcome per config, in order: {"id", "success", "result"} or {"id", "success", "error"}.
+        A statement that writes no record, as when record permissions deny it, counts as a failure.
+        """
+        outcomes = []
+        for batch_start in range(0, len(module_configs), batch_size):
+            batch = module_configs[batch_start:batch_start + batch_size]
+            statements, params = [], {}
+            for i, config in enumerate(batch):
+                table, _, name = config.get('id', '').partition(':')
+                if table not in MODULE_TABLES or not name:
+                    raise ValueError(f"Invalid module id: {config.get('id')}")
+                statements.append(f"UPDATE type::thing($table_{i}, $name_{i}) CONTENT $content_{i};")
+                params[f"table_{i}"] = table
+                params[f"name_{i}"] = name
+                params[f"content_{i}"] = {k: v for k, v in config.items() if k != 'id'}
+
+            if atomic:
+                statements = ["BEGIN TRANSACTION;"] + statements + ["COMMIT TRANSACTION;"]
+            results = await self.surrealdb.query("\n".join(statements), params)
+            if len(results) != len(batch):
+                raise RuntimeError(f"Expected {len(batch)} results from the hub, got {len(results)}")
+
+            for config, result in zip(batch, results):
+                if result.get('status') == 'OK' and result.get('result'):
+                    outcomes.append({"id": config['id'], "success": True, "result": result.get('result')})
+                elif result.get('status') == 'OK':
+                    # Record permissions filter out writes silently: the statement succeeds with no result
+                    outcomes.append({"id": config['id'], "success": False, "error": "No record was written (permission denied?)"})
+                else:
+                    outcomes.append({"id": config['id'], "success": False, "error": result.get('result') or result.get('detail')})
+        return outcomes
 
     async def close(self):
         """Close the database connection"""
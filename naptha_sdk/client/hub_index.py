@@ -0,0 +1,187 @@
+import asyncio
+import inspect
+import json
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+import websockets
+from surrealdb import Surreal
+
+from naptha_sdk.utils import get_logger
+
+logger = get_logger(__name__)
+
+HUB_INDEX_TABLES = ("node", "agent", "orchestrator", "environment", "persona")
+RECONNECT_DELAY = 5
+
+
+class HubIndex:
+    """An in-memory index of hub records, kept up to date by SurrealDB live queries.
+
+    The index takes a snapshot of each table through the hub and then applies CREATE, UPDATE
+    and DELETE notifications pushed by the hub, so long-running processes can route by the
+    registry without polling it. Callbacks registered with on_change are called as
+    callback(action, table, record) for every change; they may be plain functions or coroutines.
+
+    Live notifications are read on a dedicated connection authenticated with the hub's session
+    token, because the SurrealDB client reads responses in order and cannot share a connection
+    between requests and pushed notifications. Once live queries are registered, requests on
+    that connection are matched to their replies by id, and notifications that arrive in between
+    are kept and applied in order.
+    """
+
+    def __init__(self, hub, tables: Iterable[str] = HUB_INDEX_TABLES):
+        self.hub = hub
+        self.tables = list(tables)
+        self.records: Dict[str, Dict[str, Dict]] = {table: {} for table in self.tables}
+        self._callbacks: List[Callable] = []
+        self._connection: Optional[Surreal] = None
+        self._live_queries: Dict[str, str] = {}
+        self._buffered: List[Dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+
+    def on_change(self, callback: Callable) -> Callable:
+        """Register a callback for changes to the index. Can be used as a decorator."""
+        self._callbacks.append(callback)
+        return callback
+
+    def get(self, table: str, record_id: str) -> Optional[Dict]:
+        return self.records[table].get(record_id)
+
+    def list(self, table: str, **filters) -> List[Dict]:
+        """List indexed records of a table, optionally filtered by exact field values."""
+        return [
+            record for record in self.records[table].values()
+            if all(record.get(field) == value for field, value in filters.items() if value is not None)
+        ]
+
+    async def start(self):
+        """Load the initial snapshot and start following changes on the hub."""
+        if self._task is None:
+            await self._connect()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def _connect(self):
+        self._connection = Surreal(self.hub.hub_url)
+        await self._connection.connect()
+        await self._connection.use(namespace=self.hub.ns, database=self.hub.db)
+        if self.hub.token:
+            await self._connection.authenticate(self.hub.token)
+
+        # Register live queries before taking the snapshot so no change is missed in between
+        self._live_queries = {}
+        self._buffered = []
+        for table in self.tables:
+            live_id = await self._call("live", table)
+            self._live_queries[live_id] = table
+
+        for table in self.tables:
+            records = await self.hub.list_updated_since(table)
+            await self._apply_snapshot(table, {record['id']: record for record in records})
+        self._loaded = True
+        logger.info(f"Hub index loaded: {', '.join(f'{len(self.records[t])} {t}s' for t in self.tables)}")
+
+    async def _disconnect(self):
+        if self._connection is not None:
+            try:
+                for live_id in self._live_queries:
+                    await self._call("kill", live_id)
+                await self._connection.close()
+            except Exception as e:
+                logger.info(f"Error closing hub index connection: {e}")
+            finally:
+                self._connection = None
+                self._live_queries = {}
+                self._buffered = []
+
+    async def _run(self):
+        while True:
+            try:
+                if self._connection is None:
+                    await self._connect()
+                while self._buffered:
+                    await self._handle_notification(self._buffered.pop(0).get("result"))
+                while True:
+                    message = json.loads(await self._connection.ws.recv())
+                    await self._handle_notification(message.get("result"))
+            except asyncio.CancelledError:
+                raise
+            except (websockets.ConnectionClosed, OSError) as e:
+                logger.error(f"Hub index connection lost: {e}. Reconnecting in {RECONNECT_DELAY}s...")
+            except Exception as e:
+                logger.error(f"Hub index error: {e}. Reconnecting in {RECONNECT_DELAY}s...")
+            await self._disconnect()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _call(self, method: str, *params):
+        """Send a request on the live connection and return the result of its reply.
+
+        Messages read before the reply are live notifications; they are buffered rather than
+        mistaken for the reply.
+        """
+        request_id = uuid.uuid4().hex
+        await self._connection.ws.send(json.dumps({"id": request_id, "method": method, "params": params}))
+        while True:
+            message = json.loads(await self._connection.ws.recv())
+            if message.get("id") != request_id:
+                self._buffered.append(message)
+                continue
+            if message.get("error"):
+                raise RuntimeError(f"Hub {method} request failed: {message['error']}")
+            return message.get("result")
+
+    async def _apply_snapshot(self, table: str, records: Dict[str, Dict]):
+        """Replace a table with a fresh snapshot, reporting what changed while we were disconnected."""
+        previous, self.records[table] = self.records[table], records
+        if not self._loaded:
+            return
+        for record_id, record in records.items():
+            if record_id not in previous:
+                await self._notify("CREATE", table, record)
+            elif previous[record_id] != record:
+                await self._notify("UPDATE", table, record)
+        for record_id, record in previous.items():
+            if record_id not in records:
+                await self._notify("DELETE", table, record)
+
+    async def _handle_notification(self, notification):
+        if not isinstance(notification, dict) or notification.get("id") not in self._live_queries:
+            return
+        table = self._live_queries[notification["id"]]
+        action = notification.get("action")
+        record = notification.get("result")
+        if action == "DELETE":
+            record_id = record.get("id") if isinstance(record, dict) else record
+            record = self.records[table].pop(record_id, None) or {"id": record_id}
+        elif action in ("CREATE", "UPDATE") and isinstance(record, dict):
+            self.records[table][record["id"]] = record
+        else:
+            return
+        await self._notify(action, table, record)
+
+    async def _notify(self, action: str, table: str, record: Dict):
+        for callback in self._callbacks:
+            try:
+                result = callback(action, table, record)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error in hub index callback {callback}: {e}")
@@ -1,18 +1,15 @@
 import asyncio
+import importlib.util
 import inspect
 import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from dotenv import load_dotenv
 
-from naptha_sdk.client.hub import Hub
-from naptha_sdk.client.node import Node
-from naptha_sdk.client.services import Services
-from naptha_sdk.package_manager import AGENT_DIR, add_files_to_package, add_dependencies_to_pyproject, git_add_commit, \
-    init_agent_package, publish_ipfs_package, render_agent_code, write_code_to_package
-from naptha_sdk.schemas import User
-from naptha_sdk.scrape import scrape_init, scrape_func, scrape_func_params
+from naptha_sdk.cache import FileCache
 from naptha_sdk.user import get_public_key
 from naptha_sdk.utils import get_logger
 
@@ -20,24 +17,79 @@ logger = get_logger(__name__)
 
 load_dotenv(override=True)
 
+PUBLISH_UPLOAD_CONCURRENCY = int(os.getenv("NAPTHA_PUBLISH_UPLOAD_CONCURRENCY", 4))
+
+# Content hash and IPFS hash of the last successful publish of each agent package
+_build_cache = FileCache("build_cache")
+
+# What the @agent decorator does when a module is imported: "eager" packages and registers the agent
+# right away, "lazy" only records it for `naptha build`, "background" packages and registers it in a
+# worker thread without blocking the import
+AGENT_BUILD_MODE = os.getenv("NAPTHA_AGENT_BUILD_MODE", "eager")
+AGENT_BUILD_MODES = ("eager", "lazy", "background")
+
+# Agents declared with the @agent decorator, by name
+_declared_agents = {}
+_background_builder = None
+
 class Naptha:
-    """The entry point into Naptha."""
+    """The entry point into Naptha.
+
+    The node, hub, services and registry clients are created, and their modules imported, the
+    first time they are used, so commands only pay for the clients they need.
+    """
 
     def __init__(self):
         self.public_key = get_public_key(os.getenv("PRIVATE_KEY")) if os.getenv("PRIVATE_KEY") else None
-        self.user = User(id=f"user:{self.public_key}")
         self.hub_username = os.getenv("HUB_USERNAME", None)
         self.hub_url = os.getenv("HUB_URL", None)
         self.node_url = os.getenv("NODE_URL", None)
         self.routing_url = os.getenv("ROUTING_URL", None)
         self.indirect_node_id = os.getenv("INDIRECT_NODE_ID", None)
-        self.node = Node(
-            node_url=self.node_url,
-            routing_url=self.routing_url,
-            indirect_node_id=self.indirect_node_id
-        )
-        self.services = Services()
-        self.hub = Hub(self.hub_url, self.public_key)  
+        self._user = None
+        self._node = None
+        self._services = None
+        self._hub = None
+        self._registry = None
+
+    @property
+    def user(self):
+        if self._user is None:
+            from naptha_sdk.schemas import User
+            self._user = User(id=f"user:{self.public_key}")
+        return self._user
+
+    @property
+    def node(self):
+        if self._node is None:
+            from naptha_sdk.client.node import Node
+            self._node = Node(
+                node_url=self.node_url,
+                routing_url=self.routing_url,
+                indirect_node_id=self.indirect_node_id
+            )
+        return self._node
+
+    @property
+    def services(self):
+        if self._services is None:
+            from naptha_sdk.client.services import Services
+            self._services = Services()
+        return self._services
+
+    @property
+    def hub(self):
+        if self._hub is None:
+            from naptha_sdk.client.hub import Hub
+            self._hub = Hub(self.hub_url, self.public_key)
+        return self._hub
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            from naptha_sdk.client.registry import RegistryCache
+            self._registry = RegistryCache(self.hub)
+        return self._registry
 
     async def __aenter__(self):
         """Async enter method for context manager"""
@@ -67,22 +119,87 @@ class Naptha:
             else:
                 logger.error(f"Failed to create agent {name}")
 
-    async def publish_agents(self):
+    async def publish_agents(self, max_workers=None, max_uploads=PUBLISH_UPLOAD_CONCURRENCY, force=False):
+        """Publish all agent packages in AGENT_DIR to IPFS and register them with the hub.
+
+        Packages are committed, zipped and built into wheels in a thread pool, uploaded to IPFS
+        with at most max_uploads packages in flight, and registered with the hub in a single batch,
+        with the wheel as wheel_url. Packages whose content hash matches the last successful publish
+        to the same hub and account are skipped unless force is set, as long as the hub still has
+        their record.
+        """
+        from naptha_sdk.package_manager import AGENT_DIR, build_package_archive, hash_package, write_files_to_ipfs
+
         logger.info(f"Publishing Agent Packages...")
         start_time = time.time()
 
         path = Path.cwd() / AGENT_DIR
         agents = [item.name for item in path.iterdir() if item.is_dir()]
 
-        agent = agents[0]
-        for agent in agents:
-            git_add_commit(agent)
-            _, response = await publish_ipfs_package(agent)
+        loop = asyncio.get_running_loop()
+        upload_semaphore = asyncio.Semaphore(max_uploads)
+        timings = {agent: {} for agent in agents}
+        content_hashes = {}
+        published_urls = {}
+
+        def build_key(agent):
+            return f"{self.hub_url}|{self.hub_username}|{path / agent}"
+
+        async def publish_package(pool, agent):
+            stage_start = time.time()
+            content_hash = await loop.run_in_executor(pool, hash_package, agent)
+            cached = _build_cache.get(build_key(agent))
+            if (not force and cached and cached["content_hash"] == content_hash
+                    and published_urls.get(f"agent:{agent}") == f"ipfs://{cached['ipfs_hash']}"):
+                timings[agent]["package"] = time.time() - stage_start
+                logger.info(f"Agent {agent} is unchanged since it was published to ipfs://{cached['ipfs_hash']}, skipping")
+                return None
+            content_hashes[agent] = content_hash
+
+            output_zip_file, wheel_file = await loop.run_in_executor(pool, build_package_archive, agent)
+            timings[agent]["package"] = time.time() - stage_start
+
+            async with upload_semaphore:
+                stage_start = time.time()
+                uploads = await write_files_to_ipfs([f for f in [output_zip_file, wheel_file] if f])
+                timings[agent]["upload"] = time.time() - stage_start
+            for status, response in uploads:
+                if status != 201:
+                    raise Exception(response["message"])
+            response = uploads[0][1]
+            if wheel_file:
+                response["wheel_ipfs_hash"] = uploads[1][1]["ipfs_hash"]
             logger.info(f"Published Agent: {agent}")
-        
-            # Register agent with hub
-            async with self.hub:
-                _, _, user_id = await self.hub.signin(self.hub_username, os.getenv("HUB_PASSWORD"))
+            return response
+
+        async with self.hub:
+            if not self.hub.is_authenticated:
+                await self.hub.signin(self.hub_username, os.getenv("HUB_PASSWORD"))
+            if not force:
+                # Only skip packages whose hub record is still the one published from the cache
+                for record in await self.hub.list_agents(fields=["id", "url"], author=self.hub.user_id):
+                    published_urls[str(record["id"])] = record.get("url")
+            # Packaging is mostly hashing, zlib and file I/O, which release the GIL. Threads also avoid
+            # worker processes re-importing a user's __main__ that calls publish_agents unguarded
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="naptha-package") as pool:
+                results = await asyncio.gather(*(publish_package(pool, agent) for agent in agents), return_exceptions=True)
+
+            ipfs_responses = {}
+            for agent, result in zip(agents, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to publish agent {agent}: {result}")
+                elif result is not None:
+                    ipfs_responses[agent] = result
+            unchanged = len(agents) - len(content_hashes)
+
+            if not ipfs_responses:
+                logger.info(f"No agents to register ({unchanged} unchanged)")
+                return
+
+            # Register agents with the hub in the same session
+            register_start = time.time()
+            agent_configs = []
+            for agent, response in ipfs_responses.items():
                 agent_config = {
                     "id": f"agent:{agent}",
                     "name": agent,
@@ -93,12 +210,84 @@ class Naptha:
                     "type": "package",
                     "version": "0.1"
                 }
-                logger.info(f"Registering Agent {agent_config}")
-                agent = await self.hub.create_or_update_agent(agent_config)
+                if "wheel_ipfs_hash" in response:
+                    agent_config["wheel_url"] = f'ipfs://{response["wheel_ipfs_hash"]}'
+                agent_configs.append(agent_config)
+            logger.info(f"Registering {len(agent_configs)} Agents")
+            for outcome in await self.hub.upsert_modules(agent_configs):
+                if outcome['success']:
+                    logger.info(f"Registered {outcome['id']}")
+                    agent = outcome['id'].split(':', 1)[1]
+                    _build_cache.set(build_key(agent), {
+                        "content_hash": content_hashes[agent],
+                        "ipfs_hash": ipfs_responses[agent]["ipfs_hash"],
+                    })
+                else:
+                    logger.error(f"Failed to register {outcome['id']}: {outcome['error']}")
+            # Make the next listing sync with the hub instead of showing the old records
+            self.registry.invalidate("agent")
+        register_time = time.time() - register_start
 
         end_time = time.time()
         total_time = end_time - start_time
-        logger.info(f"Total time taken to publish {len(agents)} agents: {total_time:.2f} seconds")
+        for stage in ["package", "upload"]:
+            stage_times = [agent_timings[stage] for agent_timings in timings.values() if stage in agent_timings]
+            if stage_times:
+                logger.info(f"{stage.title()} stage: total {sum(stage_times):.2f}s, slowest agent {max(stage_times):.2f}s")
+        logger.info(f"Register stage: {register_time:.2f}s")
+        logger.info(f"Total time taken to publish {len(ipfs_responses)}/{len(agents)} agents ({unchanged} unchanged): {total_time:.2f} seconds")
+
+    async def register_agents(self, names):
+        """Register agent packages with the hub, signing in once for all of them."""
+        async with self.hub:
+            if not self.hub.is_authenticated:
+                await self.hub.signin(self.hub_username, os.getenv("HUB_PASSWORD"))
+            agent_configs = [{
+                "id": f"agent:{name}",
+                "name": name,
+                "description": name,
+                "author": self.hub.user_id,
+                "url": "None",
+                "type": "package",
+                "version": "0.1"
+            } for name in names]
+            logger.info(f"Registering {len(agent_configs)} Agents")
+            registered = []
+            for outcome in await self.hub.upsert_modules(agent_configs):
+                if outcome['success']:
+                    logger.info(f"Agent {outcome['id']} created successfully")
+                    registered.append(outcome['id'].split(':', 1)[1])
+                else:
+                    logger.error(f"Failed to create agent {outcome['id']}: {outcome['error']}")
+            self.registry.invalidate("agent")
+            return registered
+
+    async def build_agents(self, names=None, register=True):
+        """Package agents declared with the @agent decorator and register them with the hub.
+
+        Packages are built concurrently in worker threads. By default every declared agent is built.
+        """
+        names = list(_declared_agents) if names is None else list(names)
+        unknown = [name for name in names if name not in _declared_agents]
+        if unknown:
+            raise ValueError(f"Unknown agents: {', '.join(unknown)}. Declared agents: {', '.join(_declared_agents) or 'none'}")
+
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, build_agent_package, name) for name in names), return_exceptions=True
+        )
+        built = []
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to build agent {name}: {result}")
+            else:
+                built.append(name)
+        logger.info(f"Built {len(built)}/{len(names)} agent packages in {time.time() - start_time:.2f} seconds")
+
+        if register and built:
+            await self.register_agents(built)
+        return built
 
     def build(self):
         asyncio.run(self.build_agents())
@@ -113,20 +302,83 @@ class Naptha:
         asyncio.run(self.connect_publish())
 
 
-def agent(name):
+def build_agent_package(name):
+    """Scrape a declared agent and write its package to AGENT_DIR."""
+    from naptha_sdk.package_manager import add_files_to_package, add_dependencies_to_pyproject, init_agent_package, \
+        render_agent_code, write_code_to_package
+    from naptha_sdk.scrape import scrape_init, scrape_func, scrape_func_params
+
+    declared = _declared_agents[name]
+    func = declared["func"]
+    variables = scrape_init(declared["file"])
+    params = scrape_func_params(func)
+    agent_code, obj_name, local_modules, selective_import_modules, standard_import_modules, variable_modules, union_modules = scrape_func(
+        func, variables, declared.get("globals"))
+    agent_code = render_agent_code(name, agent_code, obj_name, local_modules, selective_import_modules, standard_import_modules, variable_modules, union_modules, params,
+                                   reuse_instances=not declared["stateful"])
+    init_agent_package(name)
+    write_code_to_package(name, agent_code)
+    add_dependencies_to_pyproject(name, selective_import_modules + standard_import_modules)
+    add_files_to_package(name, params, os.getenv("HUB_USERNAME"))
+
+
+def _build_and_register(name):
+    try:
+        build_agent_package(name)
+        asyncio.run(Naptha().register_agents([name]))
+    except Exception as e:
+        logger.error(f"Failed to build agent {name} in the background: {e}")
+
+
+def _submit_background_build(name):
+    global _background_builder
+    if _background_builder is None:
+        _background_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="naptha-agent-build")
+    return _background_builder.submit(_build_and_register, name)
+
+
+def load_agent_module(file_path):
+    """Import a module that declares agents, recording them with @agent without building them."""
+    global AGENT_BUILD_MODE
+    file_path = os.path.abspath(file_path)
+    module_dir = os.path.dirname(file_path)
+    if module_dir not in sys.path:
+        sys.path.insert(0, module_dir)
+    spec = importlib.util.spec_from_file_location(Path(file_path).stem, file_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    previous_mode, AGENT_BUILD_MODE = AGENT_BUILD_MODE, "lazy"
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        AGENT_BUILD_MODE = previous_mode
+    return module
+
+
+def agent(name, mode=None, stateful=False):
+    """Declare a function as a Naptha agent.
+
+    mode is one of AGENT_BUILD_MODES and defaults to AGENT_BUILD_MODE (NAPTHA_AGENT_BUILD_MODE).
+    Stateful agents get a new instance for every run instead of reusing one between runs.
+    """
     def decorator(func):
+        build_mode = mode or AGENT_BUILD_MODE
+        if build_mode not in AGENT_BUILD_MODES:
+            raise ValueError(f"Invalid agent build mode: {build_mode}. Must be one of {AGENT_BUILD_MODES}")
         frame = inspect.currentframe()
         caller_frame = frame.f_back
-        instantiation_file = caller_frame.f_code.co_filename
-        variables = scrape_init(instantiation_file)
-        params = scrape_func_params(func)
-        agent_code, obj_name, local_modules, selective_import_modules, standard_import_modules, variable_modules, union_modules = scrape_func(func, variables)
-        agent_code = render_agent_code(name, agent_code, obj_name, local_modules, selective_import_modules, standard_import_modules, variable_modules, union_modules, params)
-        init_agent_package(name)
-        write_code_to_package(name, agent_code)
-        add_dependencies_to_pyproject(name, selective_import_modules + standard_import_modules)
-        add_files_to_package(name, params, os.getenv("HUB_USERNAME"))
+        _declared_agents[name] = {"func": func, "file": caller_frame.f_code.co_filename, "stateful": stateful}
+
+        if build_mode == "lazy":
+            return func
+        if build_mode == "background":
+            # The declaring module is still being imported while the build runs, so scrape a copy of
+            # its globals as they are now, like an eager build would see them
+            _declared_agents[name]["globals"] = dict(func.__globals__)
+            _submit_background_build(name)
+            return func
 
+        build_agent_package(name)
         loop = asyncio.get_event_loop()
         if loop.is_running():
             asyncio.ensure_future(Naptha().create_agent(name))
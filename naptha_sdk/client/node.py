@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import shutil
@@ -16,21 +17,32 @@ from google.protobuf import struct_pb2
 from google.protobuf.json_format import MessageToDict
 from httpx import HTTPStatusError, RemoteProtocolError
 
+from naptha_sdk.cache import FileCache
 from naptha_sdk.client import grpc_server_pb2
+from naptha_sdk.client.codec import codec_for_content_type, get_codec
 from naptha_sdk.client import grpc_server_pb2_grpc
 from naptha_sdk.schemas import AgentRun, AgentRunInput, ChatCompletionRequest, EnvironmentRun, EnvironmentRunInput, OrchestratorRun, \
     OrchestratorRunInput, AgentDeployment, EnvironmentDeployment, OrchestratorDeployment
-from naptha_sdk.utils import get_logger
+from naptha_sdk.utils import get_logger, list_package_files, log_package_size_report, write_deterministic_zip
 
 logger = get_logger(__name__)
 HTTP_TIMEOUT = 300
+USER_CACHE_TTL = int(os.getenv("NAPTHA_USER_CACHE_TTL", 24 * 60 * 60))
+
+# Registration state per (node_url, public_key), shared by all Node instances in the process
+_registered_users: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+_user_checks_in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+_user_cache = FileCache("registered_users", ttl=USER_CACHE_TTL)
 
 class Node:
-    def __init__(self, node_url: Optional[str] = None, indirect_node_id: Optional[str] = None, routing_url: Optional[str] = None):
+    def __init__(self, node_url: Optional[str] = None, indirect_node_id: Optional[str] = None, routing_url: Optional[str] = None,
+                 codec: Optional[str] = None):
         self.node_url = node_url
         self.indirect_node_id = indirect_node_id
         self.routing_url = routing_url
         self.connections = {}
+        # Wire codec for request bodies and websocket messages, NODE_CODEC by default
+        self.codec = get_codec(codec)
 
         if self.node_url.startswith('ws://'):
             self.server_type = 'ws'
@@ -53,6 +65,20 @@ class Node:
         self.access_token = None
         logger.info(f"Node URL: {node_url}")
 
+    def _request_kwargs(self, payload: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """httpx request arguments that send payload, a model or plain data, in the node codec."""
+        return {
+            "content": self.codec.encode(payload),
+            "headers": {**(headers or {}), "Content-Type": self.codec.content_type, "Accept": self.codec.accept},
+        }
+
+    def _decode_response(self, response: httpx.Response, model_class=None):
+        """Decode a response body by its content type, validating it straight into model_class if given."""
+        codec = codec_for_content_type(response.headers.get("content-type"), self.codec)
+        if model_class is not None:
+            return codec.decode_model(response.content, model_class)
+        return codec.decode(response.content)
+
     async def create(self, module_type: str,
                      module_request: Union[AgentDeployment, EnvironmentDeployment, OrchestratorDeployment]):
         """Generic method to create either an agent, orchestrator, or environment.
@@ -70,18 +96,16 @@ class Node:
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
                 headers = {
-                    'Content-Type': 'application/json',
                     'Authorization': f'Bearer {self.access_token}',
                 }
                 response = await client.post(
                     endpoint,
-                    json=module_request.model_dump(),
-                    headers=headers
+                    **self._request_kwargs(module_request, headers)
                 )
                 response.raise_for_status()
 
                 # Convert response to appropriate return type
-                return response.json()
+                return self._decode_response(response)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
             raise
@@ -93,56 +117,62 @@ class Node:
             print(f"An unexpected error occurred: {e}")
             raise
 
-    async def _run_and_poll(self, run_input: Union[AgentRunInput, EnvironmentRunInput, OrchestratorRunInput, Dict], module_type: str) -> Union[AgentRun, EnvironmentRun, OrchestratorRun, Dict]:
+    async def _run_and_poll(self, run_input: Union[AgentRunInput, EnvironmentRunInput, OrchestratorRunInput, Dict], module_type: str,
+                            verbose: bool = True) -> Union[AgentRun, EnvironmentRun, OrchestratorRun, Dict]:
         """Generic method to run and poll either an agent, orchestrator, or environment.
         
         Args:
             run_input: Either AgentRunInput, OrchestratorRunInput, or environment dict
             module_type: Either 'agent', 'orchestrator', or 'environment'
+            verbose: Print the run's progress and results
         """
 
         # Start the run
-        run = await getattr(self, f'run_{module_type}')(run_input)
-        print(f"{module_type.title()} run started: {run}")
+        run = await getattr(self, f'run_{module_type}')(run_input, verbose)
+        if verbose:
+            print(f"{module_type.title()} run started: {run}")
 
         current_results_len = 0
         while True:
             # Check run status
             run = await getattr(self, f'check_{module_type}_run')(run)
             
-            output = f"{run.status} {getattr(run, f'{module_type}_deployment').module['type']} {getattr(run, f'{module_type}_deployment').module['name']}"
-            print(output)
-
             results = run.results
             status = run.status
 
-            if len(results) > current_results_len:
-                print("Output: ", results[-1])
-                current_results_len += 1
+            if verbose:
+                output = f"{run.status} {getattr(run, f'{module_type}_deployment').module['type']} {getattr(run, f'{module_type}_deployment').module['name']}"
+                print(output)
+
+                if len(results) > current_results_len:
+                    print("Output: ", results[-1])
+                    current_results_len += 1
 
             if status in ['completed', 'error']:
                 break
 
-            time.sleep(3)
+            # Don't block the event loop, so other runs can be polled concurrently
+            await asyncio.sleep(3)
 
-        if status == 'completed':
-            print(results)
-        else:
-            error_msg = run.error_message
-            print(error_msg)
+        if verbose:
+            if status == 'completed':
+                print(results)
+            else:
+                error_msg = run.error_message
+                print(error_msg)
         return run
 
-    async def run_agent_and_poll(self, agent_run_input: AgentRunInput) -> AgentRun:
+    async def run_agent_and_poll(self, agent_run_input: AgentRunInput, verbose: bool = True) -> AgentRun:
         """Run an agent and poll for results until completion."""
-        return await self._run_and_poll(agent_run_input, 'agent')
+        return await self._run_and_poll(agent_run_input, 'agent', verbose)
 
-    async def run_orchestrator_and_poll(self, orchestrator_run_input: OrchestratorRunInput) -> OrchestratorRun:
+    async def run_orchestrator_and_poll(self, orchestrator_run_input: OrchestratorRunInput, verbose: bool = True) -> OrchestratorRun:
         """Run an orchestrator and poll for results until completion."""
-        return await self._run_and_poll(orchestrator_run_input, 'orchestrator')
+        return await self._run_and_poll(orchestrator_run_input, 'orchestrator', verbose)
 
-    async def run_environment_and_poll(self, environment_input: EnvironmentRunInput) -> EnvironmentRun:
+    async def run_environment_and_poll(self, environment_input: EnvironmentRunInput, verbose: bool = True) -> EnvironmentRun:
         """Run an environment and poll for results until completion."""
-        return await self._run_and_poll(environment_input, 'environment')
+        return await self._run_and_poll(environment_input, 'environment', verbose)
 
     async def check_user_ws(self, user_input: Dict[str, str]):
         response = await self.send_receive_ws(user_input, "check_user")
@@ -168,16 +198,12 @@ class Node:
         endpoint = self.node_url + "/user/check"
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-                headers = {
-                    'Content-Type': 'application/json', 
-                }
                 response = await client.post(
                     endpoint, 
-                    json=user_input,
-                    headers=headers
+                    **self._request_kwargs(user_input)
                 )
                 response.raise_for_status()
-            return json.loads(response.text)
+            return self._decode_response(response)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
             raise  
@@ -222,16 +248,12 @@ class Node:
         endpoint = self.node_url + "/user/register"
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-                headers = {
-                    'Content-Type': 'application/json', 
-                }
                 response = await client.post(
                     endpoint, 
-                    json=user_input,
-                    headers=headers
+                    **self._request_kwargs(user_input)
                 )
                 response.raise_for_status()
-            return json.loads(response.text)
+            return self._decode_response(response)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
             raise  
@@ -251,17 +273,80 @@ class Node:
         else:
             return await self.register_user_http(user_input)
 
-    async def _run_module(self, run_input: Union[AgentRunInput, OrchestratorRunInput, EnvironmentRunInput], module_type: str) -> Union[AgentRun, OrchestratorRun, EnvironmentRun]:
+    async def check_and_register_user(self, public_key: str, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Make sure a user is registered on the node, registering it if needed.
+
+        Registered users are cached in memory and on disk for USER_CACHE_TTL seconds,
+        and concurrent callers for the same node and public key share a single request.
+        """
+        key = (self.node_url, public_key)
+        if use_cache:
+            user = self._get_cached_user(key)
+            if user is not None:
+                logger.info(f"Found cached user registration for {public_key} on {self.node_url}")
+                return user
+
+        task = _user_checks_in_flight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._check_and_register_user(public_key))
+            _user_checks_in_flight[key] = task
+
+            def _clear_in_flight(done_task):
+                if _user_checks_in_flight.get(key) is done_task:
+                    del _user_checks_in_flight[key]
+            task.add_done_callback(_clear_in_flight)
+        return await asyncio.shield(task)
+
+    async def _check_and_register_user(self, public_key: str) -> Dict[str, Any]:
+        user = await self.check_user(user_input={"public_key": public_key})
+        if user.get('is_registered'):
+            logger.info(f"Found user... {user}")
+        else:
+            logger.info("No user found. Registering user...")
+            user = await self.register_user(user_input=user)
+            logger.info(f"User registered: {user}.")
+        self._cache_user((self.node_url, public_key), user)
+        return user
+
+    def _get_cached_user(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        cached = _registered_users.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+        user = _user_cache.get(json.dumps(key))
+        if user is not None:
+            _registered_users[key] = (time.time() + USER_CACHE_TTL, user)
+        return user
+
+    def _cache_user(self, key: Tuple[str, str], user: Dict[str, Any]):
+        _registered_users[key] = (time.time() + USER_CACHE_TTL, user)
+        _user_cache.set(json.dumps(key), user)
+
+    def _forget_registered_users(self):
+        """Drop the cached registrations of every user checked against this node."""
+        for key in [key for key in _registered_users if key[0] == self.node_url]:
+            del _registered_users[key]
+        # Other processes may have cached registrations this one never loaded
+        for cache_key in _user_cache.keys():
+            if json.loads(cache_key)[0] == self.node_url:
+                _user_cache.delete(cache_key)
+
+    async def _run_module(self, run_input: Union[AgentRunInput, OrchestratorRunInput, EnvironmentRunInput], module_type: str,
+                          verbose: bool = True) -> Union[AgentRun, OrchestratorRun, EnvironmentRun]:
         """
         Generic method to run either an agent, orchestrator, or environment on a node
         
         Args:
             run_input: Either AgentRunInput, OrchestratorRunInput, or EnvironmentRunInput
             module_type: Either 'agent', 'orchestrator', or 'environment'
+            verbose: Print the run input, instead of only logging it at debug level
         """
-        print(f"Running {module_type}...")
-        print(f"Run input: {run_input}")
-        print(f"Node URL: {self.node_url}")
+        if verbose:
+            print(f"Running {module_type}...")
+            print(f"Run input: {run_input}")
+            print(f"Node URL: {self.node_url}")
+        else:
+            logger.debug(f"Running {module_type} on {self.node_url} with input: {run_input}")
 
         endpoint = f"{self.node_url}/{module_type}/run"
         
@@ -278,13 +363,11 @@ class Node:
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
                 headers = {
-                    'Content-Type': 'application/json',
                     'Authorization': f'Bearer {self.access_token}',
                 }
                 response = await client.post(
                     endpoint,
-                    json=run_input.model_dump(),
-                    headers=headers
+                    **self._request_kwargs(run_input, headers)
                 )
                 response.raise_for_status()
                 
@@ -294,9 +377,12 @@ class Node:
                     'orchestrator': OrchestratorRun,
                     'environment': EnvironmentRun
                 }[module_type]
-                return return_class(**json.loads(response.text))
+                return self._decode_response(response, return_class)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
+            if e.response.status_code in (401, 403):
+                # The node no longer accepts the user, so don't trust the cached registration
+                self._forget_registered_users()
             raise
         except RemoteProtocolError as e:
             error_msg = f"Run {module_type} failed to connect to the server at {self.node_url}. Please check if the server URL is correct and the server is running. Error details: {str(e)}"
@@ -321,19 +407,20 @@ class Node:
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
                 headers = {
-                    'Content-Type': 'application/json',
                     'Authorization': f'Bearer {self.access_token}',
                 }
                 response = await client.post(
                     endpoint,
-                    json=inference_input.model_dump(),
-                    headers=headers
+                    **self._request_kwargs(inference_input, headers)
                 )
                 print("Response: ", response.text)
                 response.raise_for_status()
-                return json.loads(response.text)
+                return self._decode_response(response)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
+            if e.response.status_code in (401, 403):
+                # The node no longer accepts the user, so don't trust the cached registration
+                self._forget_registered_users()
             raise
         except RemoteProtocolError as e:
             error_msg = f"Inference failed to connect to the server at {self.node_url}. Please check if the server URL is correct and the server is running. Error details: {str(e)}"
@@ -415,17 +502,17 @@ class Node:
         else:
             raise ValueError("Invalid server type. Server type must be either 'ws' or 'grpc'.")
 
-    async def run_agent(self, agent_run_input: AgentRunInput) -> AgentRun:
+    async def run_agent(self, agent_run_input: AgentRunInput, verbose: bool = True) -> AgentRun:
         """Run an agent on a node"""
-        return await self._run_module(agent_run_input, 'agent')
+        return await self._run_module(agent_run_input, 'agent', verbose)
 
-    async def run_orchestrator(self, orchestrator_run_input: OrchestratorRunInput) -> OrchestratorRun:
+    async def run_orchestrator(self, orchestrator_run_input: OrchestratorRunInput, verbose: bool = True) -> OrchestratorRun:
         """Run an orchestrator on a node"""
-        return await self._run_module(orchestrator_run_input, 'orchestrator')
+        return await self._run_module(orchestrator_run_input, 'orchestrator', verbose)
     
-    async def run_environment(self, environment_run_input: EnvironmentRunInput) -> EnvironmentRun:
+    async def run_environment(self, environment_run_input: EnvironmentRunInput, verbose: bool = True) -> EnvironmentRun:
         """Run an environment on a node"""
-        return await self._run_module(environment_run_input, 'environment')
+        return await self._run_module(environment_run_input, 'environment', verbose)
 
     async def check_run(
         self, 
@@ -442,7 +529,7 @@ class Node:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
                 response = await client.post(
                     f"{self.node_url}/{module_type}/check", 
-                    json=module_run.model_dump()
+                    **self._request_kwargs(module_run)
                 )
                 response.raise_for_status()
             
@@ -451,7 +538,7 @@ class Node:
                 'orchestrator': OrchestratorRun,
                 'environment': EnvironmentRun
             }[module_type]
-            return return_class(**json.loads(response.text))
+            return self._decode_response(response, return_class)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
             raise  
@@ -473,10 +560,10 @@ class Node:
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
                 response = await client.post(
-                    f"{self.node_url}/monitor/create_agent_run", json=agent_run_input.model_dump()
+                    f"{self.node_url}/monitor/create_agent_run", **self._request_kwargs(agent_run_input)
                 )
                 response.raise_for_status()
-            return AgentRun(**json.loads(response.text))
+            return self._decode_response(response, AgentRun)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
             raise  
@@ -488,10 +575,10 @@ class Node:
         try:
             async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
                 response = await client.post(
-                    f"{self.node_url}/monitor/update_agent_run", json=agent_run.model_dump()
+                    f"{self.node_url}/monitor/update_agent_run", **self._request_kwargs(agent_run)
                 )
                 response.raise_for_status()
-            return AgentRun(**json.loads(response.text))
+            return self._decode_response(response, AgentRun)
         except HTTPStatusError as e:
             logger.info(f"HTTP error occurred: {e}")
             raise  
@@ -664,25 +751,23 @@ class Node:
         client_id = await self.connect_ws(action)
         
         try:
-            if isinstance(data, AgentRunInput) or isinstance(data, OrchestratorRunInput):
-                message = data.model_dump()
-            else:
-                message = data
-            await self.connections[client_id].send(json.dumps(message))
+            message = self.codec.encode(data)
+            # JSON goes in text frames, as before; binary codecs use binary frames
+            await self.connections[client_id].send(message.decode() if self.codec.name == "json" else message)
             
             response = await self.connections[client_id].recv()
-            return json.loads(response)
+            if isinstance(response, bytes) and self.codec.name != "json":
+                return self.codec.decode(response)
+            return codec_for_content_type(None, self.codec).decode(response)
         finally:
             await self.disconnect_ws(client_id)
 
 def zip_directory(file_path, zip_path):
     """Utility function to zip the content of a directory while preserving the folder structure."""
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(file_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, start=os.path.abspath(file_path).split(os.sep)[0])
-                zipf.write(file_path, arcname)
+    folder_name = os.path.basename(os.path.abspath(file_path))
+    files = list_package_files(file_path)
+    log_package_size_report(file_path, files)
+    write_deterministic_zip(zip_path, [(path, os.path.join(folder_name, rel_path)) for path, rel_path in files])
 
 def prepare_files(file_path: str) -> List[Tuple[str, str]]:
     """Prepare files for upload."""
@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from naptha_sdk.cache import get_cache_path
+from naptha_sdk.client.hub import FIELD_NAME_PATTERN, LIST_PAGE_SIZE
+from naptha_sdk.utils import get_logger
+
+logger = get_logger(__name__)
+
+REGISTRY_TABLES = ["node", "agent", "orchestrator", "environment", "persona"]
+# Serve reads from the local registry if it was synced with the hub less than this many seconds ago
+REGISTRY_MAX_AGE = float(os.getenv("NAPTHA_REGISTRY_MAX_AGE", 300))
+
+
+class RegistryCache:
+    """A local SQLite copy of the hub registry (nodes, agents, orchestrators, environments and personas).
+
+    Reads are served locally while the copy of a table is younger than max_age. Once records with
+    an updated_at have been seen, refreshes only fetch records newer than the last one, plus the
+    list of ids to detect deleted records; otherwise they fetch the whole table.
+    """
+
+    def __init__(self, hub, db_path: Optional[str] = None, max_age: float = REGISTRY_MAX_AGE):
+        self.hub = hub
+        self.db_path = db_path or str(get_cache_path("registry.db"))
+        self.max_age = max_age
+        self._db = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    hub_url TEXT, tbl TEXT, id TEXT, data TEXT, updated_at TEXT,
+                    PRIMARY KEY (hub_url, tbl, id)
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    hub_url TEXT, tbl TEXT, synced_at REAL, high_water TEXT,
+                    PRIMARY KEY (hub_url, tbl)
+                );
+            """)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _sync_state(self, table: str):
+        return self.db.execute(
+            "SELECT synced_at, high_water FROM sync_state WHERE hub_url = ? AND tbl = ?",
+            (self.hub.hub_url, table)
+        ).fetchone()
+
+    def is_stale(self, table: str, max_age: Optional[float] = None) -> bool:
+        max_age = self.max_age if max_age is None else max_age
+        state = self._sync_state(table)
+        return state is None or time.time() - state[0] > max_age
+
+    async def refresh(self, table: str, full: bool = False) -> int:
+        """Sync one table with the hub and return the number of records fetched."""
+        if table not in REGISTRY_TABLES:
+            raise ValueError(f"Unknown registry table: {table}")
+        state = None if full else self._sync_state(table)
+        high_water = state[1] if state else None
+
+        changed = await self.hub.list_updated_since(table, high_water)
+        hub_url = self.hub.hub_url
+        local_ids = {
+            row[0] for row in self.db.execute("SELECT id FROM records WHERE hub_url = ? AND tbl = ?", (hub_url, table))
+        }
+        if high_water:
+            remote_ids = set(await self.hub.list_record_ids(table))
+            # Records that appeared without a newer timestamp (e.g. clock skew on the hub) need a full sync
+            if remote_ids - local_ids - {record['id'] for record in changed}:
+                changed = await self.hub.list_updated_since(table)
+        else:
+            # Without a high-water mark the whole table was fetched, so it already lists every id
+            remote_ids = {record['id'] for record in changed}
+
+        with self.db:
+            deleted_ids = local_ids - remote_ids
+            self.db.executemany(
+                "DELETE FROM records WHERE hub_url = ? AND tbl = ? AND id = ?",
+                [(hub_url, table, record_id) for record_id in deleted_ids]
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO records (hub_url, tbl, id, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (hub_url, table, record['id'], json.dumps(record, default=str),
+                     str(record['updated_at']) if record.get('updated_at') else None)
+                    for record in changed
+                ]
+            )
+            timestamps = [str(record['updated_at']) for record in changed if record.get('updated_at')]
+            if high_water:
+                timestamps.append(high_water)
+            self.db.execute(
+                "INSERT OR REPLACE INTO sync_state (hub_url, tbl, synced_at, high_water) VALUES (?, ?, ?, ?)",
+                (hub_url, table, time.time(), max(timestamps) if timestamps else None)
+            )
+
+        logger.info(f"Synced {table} registry: {len(changed)} updated, {len(deleted_ids)} deleted")
+        return len(changed)
+
+    def invalidate(self, table: str):
+        """Force the next read of a table to sync with the hub."""
+        with self.db:
+            self.db.execute(
+                "UPDATE sync_state SET synced_at = 0 WHERE hub_url = ? AND tbl = ?",
+                (self.hub.hub_url, table)
+            )
+
+    async def refresh_all(self, full: bool = False):
+        for table in REGISTRY_TABLES:
+            await self.refresh(table, full=full)
+
+    async def _ensure_fresh(self, table: str, max_age: Optional[float] = None):
+        if self.is_stale(table, max_age):
+            await self.refresh(table)
+
+    def _select(self, table: str, record_id: Optional[str] = None, limit: Optional[int] = None,
+                start: Optional[int] = None, **filters) -> List[Dict]:
+        conditions = ["hub_url = ?", "tbl = ?"]
+        params = [self.hub.hub_url, table]
+        if record_id:
+            conditions.append("id = ?")
+            params.append(record_id)
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if not FIELD_NAME_PATTERN.match(field):
+                raise ValueError(f"Invalid field name: {field}")
+            conditions.append(f"json_extract(data, '$.{field}') = ?")
+            params.append(value)
+        query = f"SELECT data FROM records WHERE {' AND '.join(conditions)} ORDER BY id"
+        if limit is not None or start is not None:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else limit, start or 0])
+        return [json.loads(row[0]) for row in self.db.execute(query, params)]
+
+    async def list(self, table: str, record_id: Optional[str] = None, fields: Optional[List[str]] = None,
+                   limit: Optional[int] = None, start: Optional[int] = None, max_age: Optional[float] = None,
+                   **filters) -> List[Dict]:
+        """List records from the local registry, refreshing it first if it is stale."""
+        await self._ensure_fresh(table, max_age)
+        records = self._select(table, record_id, limit, start, **filters)
+        if fields:
+            records = [{field: record.get(field) for field in fields} for record in records]
+        return records
+
+    async def _iter_table(self, table: str, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None,
+                          **filters) -> AsyncIterator[List]:
+        await self._ensure_fresh(table)
+        if page_size < 1:
+            raise ValueError(f"page_size must be a positive integer, got {page_size}")
+        start = 0
+        while True:
+            page = await self.list(table, fields=fields, limit=page_size, start=start, max_age=float("inf"), **filters)
+            if page:
+                yield page
+            if len(page) < page_size:
+                break
+            start += page_size
+
+    async def list_nodes(self, **kwargs) -> List:
+        return await self.list("node", **kwargs)
+
+    async def list_agents(self, agent_name=None, **kwargs) -> List:
+        return await self.list("agent", agent_name, **kwargs)
+
+    async def list_orchestrators(self, orchestrator_name=None, **kwargs) -> List:
+        return await self.list("orchestrator", orchestrator_name, **kwargs)
+
+    async def list_environments(self, environment_name=None, **kwargs) -> List:
+        return await self.list("environment", environment_name, **kwargs)
+
+    async def list_personas(self, persona_name=None, **kwargs) -> List:
+        return await self.list("persona", persona_name, **kwargs)
+
+    def iter_nodes(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("node", page_size, fields, **filters)
+
+    def iter_agents(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("agent", page_size, fields, **filters)
+
+    def iter_orchestrators(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("orchestrator", page_size, fields, **filters)
+
+    def iter_environments(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("environment", page_size, fields, **filters)
+
+    def iter_personas(self, page_size: int = LIST_PAGE_SIZE, fields: Optional[List[str]] = None, **filters) -> AsyncIterator[List]:
+        return self._iter_table("persona", page_size, fields, **filters)
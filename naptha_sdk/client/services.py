@@ -1,8 +1,10 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
 import tempfile
 import tarfile
+import time
 import json
 from pathlib import Path
 from payments_py import Payments, Environment
@@ -13,42 +15,83 @@ import shutil
 
 load_dotenv()
 
+SERVICES_CONCURRENCY = int(os.getenv("NAPTHA_SERVICES_CONCURRENCY", 10))
+DDO_CACHE_TTL = float(os.getenv("NAPTHA_DDO_CACHE_TTL", 60 * 60))
+SERVICE_TOKEN_CACHE_TTL = float(os.getenv("NAPTHA_SERVICE_TOKEN_CACHE_TTL", 5 * 60))
+
 class Services:
-    def __init__(self):
-        self.payments = Payments(session_key=os.getenv("SESSION_KEY"), environment=Environment.appTesting, version="0.1.0", marketplace_auth_token=os.getenv("MARKETPLACE_AUTH_TOKEN"))
+    """Async client for Nevermined services.
+
+    The payments client is synchronous, so its calls run in a pool of `concurrency` threads.
+    Asset DDOs and service tokens are cached in memory for DDO_CACHE_TTL and SERVICE_TOKEN_CACHE_TTL
+    seconds, and concurrent lookups of the same DID share one request. Pass `payments` to use a
+    different payments client, such as a local stand-in.
+    """
+
+    def __init__(self, payments=None, concurrency: int = SERVICES_CONCURRENCY):
+        self.payments = payments or Payments(session_key=os.getenv("SESSION_KEY"), environment=Environment.appTesting, version="0.1.0", marketplace_auth_token=os.getenv("MARKETPLACE_AUTH_TOKEN"))
         self.naptha_plan_did = os.getenv("NAPTHA_PLAN_DID")
         self.wallet_address = os.getenv("WALLET_ADDRESS") 
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="naptha-services")
+        self._ddos: Dict[str, Tuple[float, Dict]] = {}
+        self._tokens: Dict[str, Tuple[float, Tuple[str, str]]] = {}
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def _call(self, method: str, *args):
+        response = await asyncio.get_running_loop().run_in_executor(self._executor, getattr(self.payments, method), *args)
+        return json.loads(response.content.decode())
+
+    async def _cached(self, cache: Dict, ttl: float, kind: str, did: str, fetch, use_cache: bool = True):
+        if use_cache:
+            cached = cache.get(did)
+            if cached and cached[0] > time.time():
+                return cached[1]
 
-    def show_credits(self):
-        response = self.payments.get_subscription_balance(self.naptha_plan_did, self.wallet_address)
-        creds = json.loads(response.content.decode())["balance"]
+        key = (kind, did)
+        task = self._in_flight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fetch(did))
+            self._in_flight[key] = task
+
+            def _clear_in_flight(done_task):
+                if self._in_flight.get(key) is done_task:
+                    del self._in_flight[key]
+                if not done_task.cancelled() and done_task.exception() is None:
+                    cache[did] = (time.time() + ttl, done_task.result())
+            task.add_done_callback(_clear_in_flight)
+        return await asyncio.shield(task)
+
+    async def show_credits(self):
+        result = await self._call("get_subscription_balance", self.naptha_plan_did, self.wallet_address)
+        creds = result["balance"]
         print('Credits: ', creds)
         return creds
 
-    def get_service_url(self, service_did):
-        response = self.payments.get_service_details(service_did)
+    async def get_service_url(self, service_did):
+        response = await asyncio.get_running_loop().run_in_executor(self._executor, self.payments.get_service_details, service_did)
         print('Service URL: ', response)
         return response
 
-    def get_service_details(self, service_did):
-        response = self.payments.get_service_token(service_did)
-        result = json.loads(response.content.decode())
+    async def _fetch_service_token(self, service_did):
+        result = await self._call("get_service_token", service_did)
         access_token = result['token']['accessToken']
         proxy_address = result['token']['neverminedProxyUri']
         return access_token, proxy_address
 
-    def get_asset_ddo(self, service_did):
-        response = self.payments.get_asset_ddo(service_did)
-        result = json.loads(response.content.decode())
-        service_name = result['service'][0]['attributes']['main']['name']
+    async def get_service_details(self, service_did, use_cache: bool = True):
+        return await self._cached(self._tokens, SERVICE_TOKEN_CACHE_TTL, "token", service_did, self._fetch_service_token, use_cache)
+
+    async def _fetch_asset_ddo(self, service_did):
+        return await self._call("get_asset_ddo", service_did)
+
+    async def get_asset_ddo(self, service_did, use_cache: bool = True):
+        ddo = await self._cached(self._ddos, DDO_CACHE_TTL, "ddo", service_did, self._fetch_asset_ddo, use_cache)
+        service_name = ddo['service'][0]['attributes']['main']['name']
         return service_name
 
-    def list_services(self):
-        response = self.payments.get_subscription_associated_services(self.naptha_plan_did)
-        service_dids = json.loads(response.content.decode())
-        service_names = []
-        for did in service_dids:
-            service_names.append(self.get_asset_ddo(did))
+    async def list_services(self, use_cache: bool = True):
+        service_dids = await self._call("get_subscription_associated_services", self.naptha_plan_did)
+        service_names = await asyncio.gather(*(self.get_asset_ddo(did, use_cache) for did in service_dids))
+        service_names = list(service_names)
         print('Services: ', service_names)
         return service_names
-
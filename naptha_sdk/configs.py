@@ -1,44 +1,109 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from pydantic import ValidationError
 from naptha_sdk.package_manager import load_persona
 from naptha_sdk.schemas import AgentDeployment, EnvironmentDeployment, LLMConfig, OrchestratorDeployment
 
-def load_llm_configs(llm_configs_path):
-    with open(llm_configs_path, "r") as file:
-        llm_configs = json.loads(file.read())
+PERSONA_LOAD_CONCURRENCY = int(os.getenv("NAPTHA_PERSONA_LOAD_CONCURRENCY", 8))
+
+# Parsed config files by (path, parser), re-parsed only when the file's mtime or size changes
+_parsed_files = {}
+
+def _parse_file(file_path, parse):
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    file_key = (stat.st_mtime_ns, stat.st_size)
+    cached = _parsed_files.get((file_path, parse))
+    if cached is None or cached[0] != file_key:
+        with open(file_path, "r") as file:
+            cached = (file_key, parse(json.loads(file.read())))
+        _parsed_files[(file_path, parse)] = cached
+    return cached[1]
+
+def _parse_llm_configs(llm_configs):
     return [LLMConfig(**config) for config in llm_configs]
 
+def _index_llm_configs(llm_configs):
+    index = {}
+    for config in _parse_llm_configs(llm_configs):
+        index.setdefault(config.config_name, config)
+    return index
+
+def load_llm_configs(llm_configs_path):
+    return list(_parse_file(llm_configs_path, _parse_llm_configs))
+
+def load_llm_config_index(llm_configs_path):
+    """Return the LLM configs in a file by config_name."""
+    return _parse_file(llm_configs_path, _index_llm_configs)
+
+def _format_error(error):
+    if isinstance(error, KeyError):
+        return f"missing {error}"
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+def _validate_deployments(deployments, prepare, model, deployments_path):
+    """Build model(**deployment) for every deployment, raising one ValueError that lists every invalid one."""
+    valid, errors = [], []
+    for i, deployment in enumerate(deployments):
+        try:
+            prepare(deployment)
+            valid.append(model(**deployment))
+        except (KeyError, TypeError, ValueError) as e:
+            name = deployment.get("name") if isinstance(deployment, dict) else None
+            errors.append(f"  {name or f'#{i}'}: {_format_error(e)}")
+    if errors:
+        raise ValueError(f"{len(errors)} invalid deployments in {deployments_path}:\n" + "\n".join(errors))
+    return valid
+
 def load_agent_deployments(agent_deployments_path, load_persona_data=True, load_persona_schema=True):
     with open(agent_deployments_path, "r") as file:
         agent_deployments = json.loads(file.read())
 
-    for deployment in agent_deployments:
-        # Load LLM config
-        config_name = deployment["agent_config"]["llm_config"]["config_name"]
-        config_path = f"{Path.cwd().name}/configs/llm_configs.json"
-        llm_configs = load_llm_configs(config_path)
-        llm_config = next(config for config in llm_configs if config.config_name == config_name)
-        deployment["agent_config"]["llm_config"] = llm_config   
+    config_path = f"{Path.cwd().name}/configs/llm_configs.json"
+    llm_configs = load_llm_config_index(config_path)
 
-        if load_persona_data:
-            persona_data, input_schema = load_persona(deployment["agent_config"]["persona_module"]["url"])
-            deployment["agent_config"]["persona_module"]["data"] = persona_data
-        if load_persona_schema:
-            deployment["agent_config"]["persona_module"]["data"] = input_schema(**persona_data)
+    # Load each distinct persona once, in parallel
+    personas = {}
+    if load_persona_data or load_persona_schema:
+        persona_modules = [
+            (deployment.get("agent_config") or {}).get("persona_module") or {} for deployment in agent_deployments
+        ]
+        persona_urls = list(dict.fromkeys(module["url"] for module in persona_modules if module.get("url")))
+        if persona_urls:
+            with ThreadPoolExecutor(max_workers=min(len(persona_urls), PERSONA_LOAD_CONCURRENCY)) as pool:
+                personas = dict(zip(persona_urls, pool.map(load_persona, persona_urls)))
 
-    return [AgentDeployment(**deployment) for deployment in agent_deployments]
+    def prepare(deployment):
+        agent_config = deployment["agent_config"]
+        config_name = agent_config["llm_config"]["config_name"]
+        if config_name not in llm_configs:
+            raise ValueError(f"llm config {config_name!r} not found in {config_path}")
+        agent_config["llm_config"] = llm_configs[config_name].model_copy()
+
+        if personas and agent_config.get("persona_module"):
+            persona_url = agent_config["persona_module"]["url"]
+            if personas.get(persona_url) is None:
+                raise ValueError(f"could not load persona from {persona_url}")
+            persona_data, input_schema = personas[persona_url]
+            agent_config["persona_module"]["data"] = input_schema(**persona_data) if load_persona_schema else persona_data
+
+    return _validate_deployments(agent_deployments, prepare, AgentDeployment, agent_deployments_path)
 
 def load_orchestrator_deployments(orchestrator_deployments_path):
     with open(orchestrator_deployments_path, "r") as file:
         orchestrator_deployments = json.loads(file.read())
-    return [OrchestratorDeployment(**deployment) for deployment in orchestrator_deployments]
+    return _validate_deployments(orchestrator_deployments, lambda deployment: None, OrchestratorDeployment, orchestrator_deployments_path)
 
 def load_environment_deployments(environment_deployments_path, config_schema=None):
     with open(environment_deployments_path, "r") as file:
         environment_deployments = json.loads(file.read())
-    
-    if config_schema:
-        for deployment in environment_deployments:
+
+    def prepare(deployment):
+        if config_schema:
             deployment["environment_config"] = config_schema
 
-    return [EnvironmentDeployment(**deployment) for deployment in environment_deployments]
+    return _validate_deployments(environment_deployments, prepare, EnvironmentDeployment, environment_deployments_path)
@@ -0,0 +1,284 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from typing import List, Optional
+
+from naptha_sdk.cache import get_cache_path
+from naptha_sdk.utils import get_logger
+
+logger = get_logger(__name__)
+
+DAEMON_SOCKET = os.getenv("NAPTHA_DAEMON_SOCKET", str(get_cache_path("daemon.sock")))
+# Commands the CLI forwards to a running daemon that was started with the same hub account, key and
+# node settings. Commands that read or write local files, or prompt for input, always run in the CLI process.
+DAEMON_COMMANDS = {"nodes", "agents", "orchestrators", "environments", "personas", "create", "run", "inference"}
+# Listing commands read from the hub without changing anything, so they are safe to retry
+LISTING_COMMANDS = {"nodes": None, "agents": "agent_name", "orchestrators": "orchestrator_name",
+                    "environments": "environment_name", "personas": "persona_name"}
+# Messages are JSON lines; listings can be long, so allow large lines
+MESSAGE_LIMIT = 16 * 1024 * 1024
+
+# The connection of the command the current task is running, used to route its output to the client
+_client_writer: contextvars.ContextVar = contextvars.ContextVar("naptha_daemon_client", default=None)
+
+
+class _OutputRouter:
+    """Stand-in for sys.stdout/sys.stderr that sends writes to the client whose command is running."""
+
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+
+    def write(self, text):
+        writer = _client_writer.get()
+        if writer is None:
+            return self.stream.write(text)
+        if text:
+            writer.write((json.dumps({self.name: text}) + "\n").encode())
+        return len(text)
+
+    def flush(self):
+        if _client_writer.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def environment_fingerprint() -> str:
+    """A digest of the settings that decide which hub account, key and node commands run with."""
+    from naptha_sdk.user import get_public_key
+    private_key = os.getenv("PRIVATE_KEY")
+    settings = [
+        os.getenv("HUB_URL"), os.getenv("HUB_USERNAME"), get_public_key(private_key) if private_key else None,
+        os.getenv("NODE_URL"), os.getenv("ROUTING_URL"), os.getenv("INDIRECT_NODE_ID"),
+    ]
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+
+def _send(writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+
+
+async def _request(message, socket_path=DAEMON_SOCKET):
+    """Send one request to the daemon and yield its replies, or raise OSError if it isn't running."""
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=MESSAGE_LIMIT)
+    try:
+        _send(writer, message)
+        await writer.drain()
+        while line := await reader.readline():
+            yield json.loads(line)
+    finally:
+        writer.close()
+
+
+async def send_command(argv: List[str], socket_path: str = DAEMON_SOCKET) -> Optional[int]:
+    """Run a CLI command in the daemon, printing its output.
+
+    Returns its exit code, or None if no daemon is running or the daemon was started with a
+    different hub account, key or node than this environment, so the command should run locally.
+    """
+    exit_code = None
+    request = {"argv": argv, "cwd": os.getcwd(), "fingerprint": environment_fingerprint()}
+    try:
+        async for message in _request(request, socket_path):
+            if "mismatch" in message:
+                logger.info("The running daemon uses a different hub account, key or node; running the command locally")
+                return None
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+            elif "exit" in message:
+                exit_code = message["exit"]
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    return 1 if exit_code is None else exit_code
+
+
+def _serialize_requests(surreal):
+    """Make concurrent requests on one SurrealDB connection take turns.
+
+    The client sends a request and then reads the next message as its reply, so overlapping
+    requests from concurrent commands would fail in recv() or receive each other's replies.
+    """
+    send_receive = surreal._send_receive
+    lock = asyncio.Lock()
+
+    async def locked_send_receive(request):
+        async with lock:
+            return await send_receive(request)
+
+    surreal._send_receive = locked_send_receive
+
+
+class NapthaDaemon:
+    """Serves CLI commands on a Unix socket from one long-lived, signed-in Naptha client.
+
+    The hub connection and session, node registration checks and the registry cache stay warm
+    between commands. Commands run concurrently, each with its output sent back to its client.
+    """
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET):
+        self.socket_path = socket_path
+        self.naptha = None
+        self.started_at = time.time()
+        self.fingerprint = environment_fingerprint()
+        self.commands_served = 0
+        self._stopped = asyncio.Event()
+        self._reconnect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        from naptha_sdk.client.naptha import Naptha
+        naptha = Naptha()
+        # Commands run concurrently but share the daemon's hub connection
+        _serialize_requests(naptha.hub.surrealdb)
+        await naptha.hub.connect()
+        if naptha.hub_username and os.getenv("HUB_PASSWORD"):
+            await naptha.hub.signin(naptha.hub_username, os.getenv("HUB_PASSWORD"))
+        self.naptha = naptha
+        logger.info(f"Daemon connected to hub {naptha.hub_url} as {naptha.hub_username}")
+
+    async def _reconnect(self, broken):
+        async with self._reconnect_lock:
+            if self.naptha is not broken:
+                return
+            try:
+                await broken.hub.close()
+            except Exception:
+                pass
+            await self._connect()
+
+    async def _run_command(self, request, writer):
+        import websockets
+        from naptha_sdk.cli import dispatch, parse_args
+
+        token = _client_writer.set(writer)
+        try:
+            args = parse_args(request["argv"])
+            if args.command not in DAEMON_COMMANDS:
+                print(f"The daemon does not run '{args.command}' commands")
+                return 2
+            if args.command == "run":
+                # Resolve the run's file arguments against the client's working directory
+                for name in ("file", "batch", "out"):
+                    if getattr(args, name):
+                        setattr(args, name, os.path.join(request.get("cwd", ""), getattr(args, name)))
+            naptha = self.naptha
+            try:
+                await dispatch(naptha, args)
+            except (websockets.ConnectionClosed, ConnectionError) as e:
+                await self._reconnect(naptha)
+                if not _is_listing(args):
+                    # The command may already have taken effect, so running it again could repeat it
+                    print(f"Error: lost the hub connection during '{args.command}' ({e})", file=sys.stderr)
+                    return 1
+                logger.info(f"Hub connection lost ({e}), reconnected and retrying")
+                await dispatch(self.naptha, args)
+            return 0
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            logger.error(traceback.format_exc())
+            return 1
+        finally:
+            _client_writer.reset(token)
+            self.commands_served += 1
+
+    async def _handle(self, reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+            if request.get("command") == "stop":
+                _send(writer, {"exit": 0})
+                self._stopped.set()
+            elif request.get("command") == "status":
+                _send(writer, {"status": {
+                    "pid": os.getpid(),
+                    "uptime": time.time() - self.started_at,
+                    "commands_served": self.commands_served,
+                    "hub_url": self.naptha.hub_url,
+                    "authenticated": self.naptha.hub.is_authenticated,
+                }})
+            elif request.get("fingerprint") != self.fingerprint:
+                _send(writer, {"mismatch": True})
+            else:
+                _send(writer, {"exit": await self._run_command(request, writer)})
+            await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.info(f"Dropped daemon client: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            if await daemon_status(self.socket_path) is not None:
+                raise RuntimeError(f"A Naptha daemon is already running on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        await self._connect()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = _OutputRouter(stdout, "stdout"), _OutputRouter(stderr, "stderr")
+        # Create the socket owner-only from the start; anyone who can connect acts with our hub credentials
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=MESSAGE_LIMIT)
+        finally:
+            os.umask(umask)
+        logger.info(f"Naptha daemon listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            await self.naptha.hub.close()
+            logger.info("Naptha daemon stopped")
+
+
+def _is_listing(args) -> bool:
+    """Whether a parsed command only lists hub records."""
+    if args.command not in LISTING_COMMANDS:
+        return False
+    name_arg = LISTING_COMMANDS[args.command]
+    return name_arg is None or not getattr(args, name_arg, None)
+
+
+async def daemon_status(socket_path: str = DAEMON_SOCKET) -> Optional[dict]:
+    try:
+        async for message in _request({"command": "status"}, socket_path):
+            return message.get("status")
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+
+async def stop_daemon(socket_path: str = DAEMON_SOCKET) -> bool:
+    try:
+        async for _ in _request({"command": "stop"}, socket_path):
+            return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+    return False
+
+
+async def daemon_command(action: str, socket_path: str = DAEMON_SOCKET):
+    if action == "start":
+        await NapthaDaemon(socket_path).serve()
+    elif action == "stop":
+        print("Daemon stopped." if await stop_daemon(socket_path) else "No daemon is running.")
+    elif action == "status":
+        status = await daemon_status(socket_path)
+        if status is None:
+            print("No daemon is running.")
+        else:
+            print(f"Daemon running (pid {status['pid']}) on {socket_path} for {status['uptime']:.0f}s, "
+                  f"{status['commands_served']} commands served, hub {status['hub_url']}, "
+                  f"{'signed in' if status['authenticated'] else 'not signed in'}")
@@ -1,24 +1,52 @@
-from git import Repo
+import ast
+import asyncio
+import base64
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from git import Git, Repo
+from git.refs.reference import Reference
+import hashlib
+import importlib.metadata
 import importlib.util
 import ipfshttpclient
 import json
-from naptha_sdk.utils import get_logger
+from naptha_sdk.cache import FileCache, get_cache_dir
+from naptha_sdk.utils import get_logger, list_package_files, log_package_size_report, write_deterministic_zip
 import os
 from pathlib import Path
-import re
 from pydantic import BaseModel
+import py_compile
+import re
+import shutil
 import subprocess
+import sys
 import tempfile
 import textwrap
+import threading
+import time
+import tokenize
+import traceback
 import tomlkit
 import yaml
-import zipfile
 
 logger = get_logger(__name__)
 
 IPFS_GATEWAY_URL="/dns/provider.akash.pro/tcp/31832/http"
+IPFS_MAX_WORKERS = int(os.getenv("NAPTHA_IPFS_MAX_WORKERS", 4))
 AGENT_DIR = "agent_pkgs"
 
+# IPFS uploads run on these threads, each keeping its own client connection open between uploads
+_ipfs_executor = ThreadPoolExecutor(max_workers=IPFS_MAX_WORKERS, thread_name_prefix="ipfs")
+_ipfs_clients = threading.local()
+
+# Commit, last remote check and installs of each persona repo, plus the personas loaded by this process
+_persona_cache = FileCache("personas")
+_loaded_personas = {}
+_persona_locks = {}
+# poetry add edits the project's pyproject.toml and poetry.lock, so only one install runs at a time
+_persona_install_lock = threading.Lock()
+
 # Certain packages cause issues with dependencies and can be slow to resolve, better to specify ranges
 PACKAGE_VERSIONS = {
     "crewai": "^0.41.1",
@@ -26,19 +54,108 @@ PACKAGE_VERSIONS = {
     "embedchain": ">=0.1.113,<0.2.0",
 }
 
-def init_agent_package(package_name):
-    subprocess.run(["poetry", "new", f"{AGENT_DIR}/{package_name}"])
-    subprocess.run(["git", "init", f"{AGENT_DIR}/{package_name}"])
+# Pin third-party dependencies to the versions installed in the environment that scraped the agent,
+# so nodes install them without resolving. Set NAPTHA_PIN_DEPENDENCIES=false to use the ranges above.
+PIN_DEPENDENCIES = os.getenv("NAPTHA_PIN_DEPENDENCIES", "true").lower() != "false"
+# Also write every installed transitive dependency, pinned, to LOCK_FILE in the package
+LOCK_DEPENDENCIES = os.getenv("NAPTHA_LOCK_DEPENDENCIES", "false").lower() == "true"
+LOCK_FILE = "requirements.lock"
+# Trust the last seen commit of a persona repo for this many seconds before checking its remote HEAD again
+PERSONA_CACHE_TTL = float(os.getenv("NAPTHA_PERSONA_CACHE_TTL", 300))
+# Also build a wheel with precompiled bytecode next to each package archive, so nodes can install
+# agents without a build step
+BUILD_WHEELS = os.getenv("NAPTHA_BUILD_WHEELS", "true").lower() != "false"
+
+PYPROJECT_TEMPLATE = """[tool.poetry]
+name = "{name}"
+version = "0.1.0"
+description = ""
+authors = ["{author}"]
+readme = "README.md"
+
+[tool.poetry.dependencies]
+python = ">=3.10,<3.13"
+
+
+[build-system]
+requires = ["poetry-core"]
+build-backend = "poetry.core.masonry.api"
+"""
+
+def init_agent_package(package_name, author=None):
+    """Scaffold a poetry package layout for an agent and initialize its git repo, keeping any existing files."""
+    package_path = Path(AGENT_DIR) / package_name
+    module_name = package_name.replace("-", "_")
+    templates = {
+        "pyproject.toml": PYPROJECT_TEMPLATE.format(name=package_name, author=author or os.getenv("HUB_USERNAME") or "naptha"),
+        "README.md": "",
+        f"{module_name}/__init__.py": "",
+        "tests/__init__.py": "",
+    }
+    for rel_path, content in templates.items():
+        file_path = package_path / rel_path
+        if not file_path.exists():
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_path.write_text(content)
+
+    if not (package_path / ".git").exists():
+        Repo.init(package_path)
 
 def is_std_lib(module_name):
+    if module_name in sys.stdlib_module_names:
+        return True
     try:
         module_spec = importlib.util.find_spec(module_name)
-        return module_spec is not None and 'site-packages' not in module_spec.origin
+        return module_spec is not None and module_spec.origin is not None and 'site-packages' not in module_spec.origin
     except ImportError:
         return False
 
-def add_dependencies_to_pyproject(package_name, packages):
-    # Adds dependencies with wildcard versioning
+@lru_cache(maxsize=None)
+def _packages_distributions():
+    return importlib.metadata.packages_distributions()
+
+def get_installed_distribution(module_name):
+    """Return the installed distribution that provides a top-level module, or None."""
+    for name in _packages_distributions().get(module_name, []):
+        try:
+            return importlib.metadata.distribution(name)
+        except importlib.metadata.PackageNotFoundError:
+            continue
+    return None
+
+def _canonical_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def resolve_installed_versions(distribution_names):
+    """Pin the given distributions and everything they require that is installed, from package metadata."""
+    versions = {}
+    queue = list(distribution_names)
+    while queue:
+        try:
+            distribution = importlib.metadata.distribution(queue.pop())
+        except importlib.metadata.PackageNotFoundError:
+            continue
+        name = distribution.metadata['Name']
+        if _canonical_name(name) in versions:
+            continue
+        versions[_canonical_name(name)] = (name, distribution.version)
+        for requirement in distribution.requires or []:
+            requirement, _, marker = requirement.partition(';')
+            if 'extra' in marker:
+                continue
+            match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)", requirement)
+            if match:
+                queue.append(match.group(1))
+    return dict(sorted(versions.values(), key=lambda item: _canonical_name(item[0])))
+
+def write_lock_file(package_name, distribution_names):
+    versions = resolve_installed_versions(distribution_names)
+    lines = [f"{name}=={version}" for name, version in versions.items()]
+    with open(f"{AGENT_DIR}/{package_name}/{LOCK_FILE}", 'w', encoding='utf-8') as file:
+        file.write("# Installed versions of the agent's dependencies when it was built\n" + "\n".join(lines) + "\n")
+
+def add_dependencies_to_pyproject(package_name, packages, pin=PIN_DEPENDENCIES, lock=LOCK_DEPENDENCIES):
+    # Adds dependencies pinned to their installed versions, or with wildcard versioning
     with open(f"{AGENT_DIR}/{package_name}/pyproject.toml", 'r', encoding='utf-8') as file:
         data = tomlkit.parse(file.read())
 
@@ -49,18 +166,28 @@ def add_dependencies_to_pyproject(package_name, packages):
         "branch": "feat/run-agent-tools"
     }
 
-    packages_to_add = []
+    distribution_names = ["python-dotenv"]
     for package in packages:
         curr_package = package['module'].split('.')[0]
-        if curr_package not in packages_to_add and not is_std_lib(curr_package):
+        if curr_package == "naptha_sdk" or is_std_lib(curr_package):
+            continue
+        distribution = get_installed_distribution(curr_package) if pin else None
+        if distribution is not None:
+            dependencies[distribution.metadata['Name']] = f"=={distribution.version}"
+            distribution_names.append(distribution.metadata['Name'])
+        else:
             dependencies[curr_package] = PACKAGE_VERSIONS.get(curr_package, "*")
-    dependencies["python-dotenv"] = "*"
+    dotenv = get_installed_distribution("dotenv") if pin else None
+    dependencies["python-dotenv"] = f"=={dotenv.version}" if dotenv else "*"
+
+    if lock:
+        write_lock_file(package_name, distribution_names)
 
     # Serialize the TOML data and write it back to the file
     with open(f"{AGENT_DIR}/{package_name}/pyproject.toml", 'w', encoding='utf-8') as file:
         file.write(tomlkit.dumps(data))
 
-def render_agent_code(agent_name, agent_code, obj_name, local_modules, selective_import_modules, standard_import_modules, variable_modules, union_modules, params):
+def render_agent_code(agent_name, agent_code, obj_name, local_modules, selective_import_modules, standard_import_modules, variable_modules, union_modules, params, reuse_instances=True):
     # Add the imports for installed modules (e.g. crewai)
     content = ''
 
@@ -83,7 +210,11 @@ def render_agent_code(agent_name, agent_code, obj_name, local_modules, selective
         content += module['source']
 
     # Add the naptha imports and logger setup
-    naptha_imports = f'''from dotenv import load_dotenv
+    naptha_imports = f'''import json
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
 from {agent_name}.schemas import InputSchema
 from naptha_sdk.utils import get_logger
 
@@ -113,14 +244,52 @@ load_dotenv()
     param_str = ", ".join(f"inputs.{name}" for name, info in params.items())
 
     # Define the new function signature
-    content += f"""def run(inputs: InputSchema, *args, **kwargs):
-    {agent_name}_0 = {obj_name}({param_str})
+    content += f"""# The most recently used agent instances are kept between runs with the same constructor arguments,
+# together with their public methods, which runs dispatch to by tool name. Set NAPTHA_REUSE_AGENT_INSTANCES=false for stateful agents that need
+# a fresh instance per run, and NAPTHA_AGENT_INSTANCE_CACHE_SIZE to change how many instances are kept.
+REUSE_AGENT_INSTANCES = os.getenv("NAPTHA_REUSE_AGENT_INSTANCES", "{str(reuse_instances).lower()}").lower() != "false"
+AGENT_INSTANCE_CACHE_SIZE = int(os.getenv("NAPTHA_AGENT_INSTANCE_CACHE_SIZE", 8))
+_agent_instances = OrderedDict()
+_agent_instances_lock = threading.Lock()
+
+# Classes a run can pass its tool input as, looked up by name
+TOOL_INPUT_CLASSES = {{name: value for name, value in globals().items() if isinstance(value, type)}}
+
+def _new_agent(*params):
+    agent = {obj_name}(*params)
+    tools = {{
+        name: getattr(agent, name) for name in dir(type(agent))
+        if not name.startswith("_") and callable(getattr(type(agent), name, None))
+    }}
+    return agent, tools
+
+def _get_agent(*params):
+    if not REUSE_AGENT_INSTANCES or AGENT_INSTANCE_CACHE_SIZE <= 0:
+        return _new_agent(*params)
+    try:
+        key = json.dumps(params, sort_keys=True)
+    except (TypeError, ValueError):
+        # Arguments that aren't plain data can't be compared between runs
+        return _new_agent(*params)
+    with _agent_instances_lock:
+        if key in _agent_instances:
+            _agent_instances.move_to_end(key)
+        else:
+            _agent_instances[key] = _new_agent(*params)
+            if len(_agent_instances) > AGENT_INSTANCE_CACHE_SIZE:
+                _agent_instances.popitem(last=False)
+        return _agent_instances[key]
 
-    tool_input_class = globals().get(inputs.tool_input_type)
-    tool_input = tool_input_class(**inputs.tool_input_value)
-    method = getattr({agent_name}_0, inputs.tool_name, None)
+def run(inputs: InputSchema, *args, **kwargs):
+    {agent_name}_0, tools = _get_agent({param_str})
 
-    return method(tool_input)
+    if inputs.tool_input_type not in TOOL_INPUT_CLASSES:
+        raise ValueError(f"Unknown tool input type: {{inputs.tool_input_type}}")
+    if inputs.tool_name not in tools:
+        raise ValueError(f"Unknown tool: {{inputs.tool_name}}")
+    tool_input = TOOL_INPUT_CLASSES[inputs.tool_input_type](**inputs.tool_input_value)
+
+    return tools[inputs.tool_name](tool_input)
 
 if __name__ == "__main__":
     from naptha_sdk.utils import load_yaml
@@ -211,9 +380,21 @@ class InputSchema(BaseModel):
         file.write(schema_code)
 
 def git_add_commit(agent_name):
-    subprocess.run(["git", "-C", f"{AGENT_DIR}/{agent_name}", "add", "-A"])
-    subprocess.run(["git", "-C", f"{AGENT_DIR}/{agent_name}", "commit", "-m", "Initial commit"])
-    subprocess.run(["git", "-C", f"{AGENT_DIR}/{agent_name}", "tag", "-f", "v0.1"])
+    """Stage the package files, commit them if anything changed and (re)tag the commit as v0.1."""
+    package_path = f"{AGENT_DIR}/{agent_name}"
+    repo = Repo.init(package_path) if not os.path.isdir(os.path.join(package_path, ".git")) else Repo(package_path)
+
+    files = {rel_path.replace(os.sep, "/") for _, rel_path in list_package_files(package_path)}
+    removed = [path for path, _ in repo.index.entries if path not in files]
+    if removed:
+        repo.index.remove(removed)
+    repo.index.add(sorted(files))
+
+    if repo.head.is_valid() and repo.index.write_tree() == repo.head.commit.tree:
+        logger.info(f"No changes to commit in {package_path}")
+    else:
+        repo.index.commit("Initial commit" if not repo.head.is_valid() else "Update agent package")
+    Reference.create(repo, "refs/tags/v0.1", repo.head.commit, force=True)
 
 def write_code_to_package(agent_name, code):
     package_path = f'{AGENT_DIR}/{agent_name}'
@@ -240,32 +421,162 @@ def zip_dir(directory_path: str) -> None:
     Zip the specified directory and write it to a file on disk.
     """
     output_zip_file = f"{directory_path}.zip"
-    with zipfile.ZipFile(output_zip_file, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zip_file.write(file_path, os.path.relpath(file_path, directory_path))
+    files = list_package_files(directory_path)
+    log_package_size_report(directory_path, files)
+    write_deterministic_zip(output_zip_file, files)
     print(f"Zipped directory '{directory_path}' to '{output_zip_file}'")
     return output_zip_file
 
+def hash_package(agent_name):
+    """Hash the paths and contents of the files that would be shipped in an agent package."""
+    package_path = f"{AGENT_DIR}/{agent_name}"
+    digest = hashlib.sha256()
+    for file_path, rel_path in sorted(list_package_files(package_path), key=lambda f: f[1]):
+        digest.update(rel_path.replace(os.sep, "/").encode())
+        digest.update(b"\0")
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _poetry_constraint_to_pep440(constraint):
+    """Translate a poetry version constraint (^1.2, ~1.2, 1.2.3, *, >=1,<2) to a PEP 440 specifier."""
+    constraint = constraint.strip()
+    if constraint in ("", "*"):
+        return ""
+    if constraint[0] in "^~" and not constraint.startswith("~="):
+        parts = [int(part) for part in re.findall(r"\d+", constraint)] or [0]
+        if constraint[0] == "~":
+            upper = [parts[0] + 1] if len(parts) == 1 else [parts[0], parts[1] + 1]
+        else:
+            index = next((i for i, part in enumerate(parts) if part != 0), len(parts) - 1)
+            upper = parts[:index] + [parts[index] + 1]
+        return f">={'.'.join(map(str, parts))},<{'.'.join(map(str, upper))}"
+    if constraint[0].isdigit():
+        return f"=={constraint}"
+    return constraint.replace(" ", "")
+
+def _requires_dist(name, constraint):
+    if isinstance(constraint, dict):
+        if "git" in constraint:
+            ref = constraint.get("rev") or constraint.get("tag") or constraint.get("branch")
+            return f"{name} @ git+{constraint['git']}" + (f"@{ref}" if ref else "")
+        constraint = constraint.get("version", "*")
+    return f"{name}{_poetry_constraint_to_pep440(str(constraint))}"
+
+def _record_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return "sha256=" + base64.urlsafe_b64encode(digest.digest()).rstrip(b"=").decode()
+
+def build_wheel(agent_name):
+    """Build a pure-Python wheel of an agent package, with bytecode precompiled, and return its path.
+
+    The bytecode is compiled for the building interpreter as unchecked-hash pycs, so it stays valid
+    after install; other Python versions ignore it and compile as usual.
+    """
+    package_path = Path(AGENT_DIR) / agent_name
+    with open(package_path / "pyproject.toml", 'r', encoding='utf-8') as file:
+        poetry = tomlkit.parse(file.read())['tool']['poetry']
+    module_name = agent_name.replace("-", "_")
+    distribution = re.sub(r"[-_.]+", "_", str(poetry['name']))
+    version = str(poetry['version'])
+    dist_info = f"{distribution}-{version}.dist-info"
+    wheel_path = Path(AGENT_DIR) / f"{distribution}-{version}-py3-none-any.whl"
+
+    with tempfile.TemporaryDirectory() as staging:
+        staging = Path(staging)
+        # Apply the package root's ignore rules, as the zip archive does, and ship only the module
+        for file_path, rel_path in list_package_files(package_path):
+            rel_path = rel_path.replace(os.sep, "/")
+            if not rel_path.startswith(f"{module_name}/"):
+                continue
+            target = staging / rel_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(file_path, target)
+            if target.suffix == ".py":
+                py_compile.compile(
+                    str(target), cfile=importlib.util.cache_from_source(str(target)),
+                    dfile=rel_path, doraise=True,
+                    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+                )
+
+        metadata = ["Metadata-Version: 2.1", f"Name: {poetry['name']}", f"Version: {version}"]
+        if poetry.get('description'):
+            metadata.append(f"Summary: {poetry['description']}")
+        for dep_name, constraint in poetry.get('dependencies', {}).items():
+            if dep_name == "python":
+                metadata.append(f"Requires-Python: {_poetry_constraint_to_pep440(str(constraint))}")
+            else:
+                metadata.append(f"Requires-Dist: {_requires_dist(dep_name, constraint)}")
+        (staging / dist_info).mkdir()
+        (staging / dist_info / "METADATA").write_text("\n".join(metadata) + "\n")
+        (staging / dist_info / "WHEEL").write_text(
+            "Wheel-Version: 1.0\nGenerator: naptha-sdk\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+        )
+        (staging / dist_info / "top_level.txt").write_text(f"{module_name}\n")
+
+        files = [
+            (str(path), path.relative_to(staging).as_posix())
+            for path in sorted(staging.rglob("*")) if path.is_file()
+        ]
+        record = [f"{arcname},{_record_hash(path)},{os.path.getsize(path)}" for path, arcname in files]
+        record.append(f"{dist_info}/RECORD,,")
+        (staging / dist_info / "RECORD").write_text("\n".join(record) + "\n")
+        files.append((str(staging / dist_info / "RECORD"), f"{dist_info}/RECORD"))
+
+        write_deterministic_zip(wheel_path, files)
+    logger.info(f"Built wheel {wheel_path}")
+    return str(wheel_path)
+
+def build_package_archive(agent_name, wheel=BUILD_WHEELS):
+    """Commit the agent package and zip it, returning the archive path and the path of its wheel (or None).
+
+    Only touches the package's own directory, so different packages can be built in parallel threads.
+    """
+    git_add_commit(agent_name)
+    output_zip_file = zip_dir(f"{AGENT_DIR}/{agent_name}")
+    return output_zip_file, build_wheel(agent_name) if wheel else None
+
+def _get_ipfs_client():
+    """Return this thread's IPFS client, connecting on first use so the HTTP session is reused."""
+    client = getattr(_ipfs_clients, "client", None)
+    if client is None:
+        client = ipfshttpclient.connect(IPFS_GATEWAY_URL, session=True)
+        _ipfs_clients.client = client
+    return client
+
+def _reset_ipfs_client():
+    client = getattr(_ipfs_clients, "client", None)
+    _ipfs_clients.client = None
+    if client is not None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
 async def write_to_ipfs(file_path):
-    """Write a file to IPFS, optionally publish to IPNS or update an existing IPNS record."""
+    """Write a file to IPFS and pin it."""
+    # The IPFS client is blocking, so run it on the IPFS worker threads to keep the event loop free
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ipfs_executor, _write_to_ipfs, file_path)
+
+async def write_files_to_ipfs(file_paths):
+    """Write and pin several files to IPFS in parallel, returning a (status, response) per file."""
+    return await asyncio.gather(*(write_to_ipfs(file_path) for file_path in file_paths))
+
+def _write_to_ipfs(file_path):
     try:
         logger.info(f"Writing file to IPFS: {file_path}")
         if not IPFS_GATEWAY_URL:
             return (500, {"message": "IPFS_GATEWAY_URL not found"})
-        
-        client = ipfshttpclient.connect(IPFS_GATEWAY_URL)
-        with tempfile.NamedTemporaryFile(mode="wb", delete=False) as tmpfile:
-            with open(file_path, "rb") as f:
-                content = f.read()            
-            tmpfile.write(content)
-            tmpfile_name = tmpfile.name
-        
-        result = client.add(tmpfile_name)
-        client.pin.add(result["Hash"])
-        os.unlink(tmpfile_name)
-        
+
+        # The client streams the file from disk, and pins it as part of the add request
+        result = _get_ipfs_client().add(file_path, pin=True)
+
         ipfs_hash = result["Hash"]
         response = {
             "message": "File written and pinned to IPFS",
@@ -274,65 +585,265 @@ async def write_to_ipfs(file_path):
 
         return (201, response)
     except Exception as e:
-        logger.error(f"Error writing file to IPFS: {e}")
-        import traceback
+        _reset_ipfs_client()
         logger.error(f"Error writing file to IPFS: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return (500, {"message": f"Error writing file to IPFS: {e}"})
 
-async def publish_ipfs_package(agent_name):
-    package_path = f"{AGENT_DIR}/{agent_name}"
-    output_zip_file = zip_dir(package_path)
-    success, response = await write_to_ipfs(output_zip_file)
-    logger.info(f"Response: {response}")
-    return success, response
+class _ReferenceCollector(ast.NodeVisitor):
+    """Split the names a module refers to by when they are looked up.
 
-# Function to sort modules based on dependencies
-def sort_modules(modules, dependencies):
-    sorted_modules = []
-    unsorted_modules = modules.copy()
-
-    while unsorted_modules:
-        for mod in unsorted_modules:
-            mod_deps = dependencies[mod['name']]
-            if all(dep in [m['name'] for m in sorted_modules] for dep in mod_deps):
-                sorted_modules.append(mod)
-                unsorted_modules.remove(mod)
+    Names in module and class bodies, base classes, decorators, default values and annotations
+    are looked up when the definition runs. Names inside function and lambda bodies are only
+    looked up when the function is called.
+    """
+
+    def __init__(self):
+        self.definition_names = set()
+        self.call_names = set()
+        self._function_depth = 0
+
+    def visit_Name(self, node):
+        (self.call_names if self._function_depth else self.definition_names).add(node.id)
+
+    def _visit_function(self, node):
+        for decorator in getattr(node, "decorator_list", ()):
+            self.visit(decorator)
+        self.visit(node.args)
+        if getattr(node, "returns", None) is not None:
+            self.visit(node.returns)
+        self._function_depth += 1
+        for statement in (node.body if isinstance(node.body, list) else [node.body]):
+            self.visit(statement)
+        self._function_depth -= 1
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_Lambda = _visit_function
+
+def classify_references(source):
+    """Return (definition_names, call_names): the names source refers to when it is run, and
+    the names it only refers to inside function bodies."""
+    try:
+        tree = ast.parse(textwrap.dedent(source))
+    except SyntaxError:
+        # Fall back to identifier tokens for snippets that don't parse on their own, assuming
+        # they are all needed when the snippet runs
+        try:
+            names = {
+                token.string for token in tokenize.generate_tokens(iter(source.splitlines(keepends=True)).__next__)
+                if token.type == tokenize.NAME
+            }
+        except (tokenize.TokenError, IndentationError):
+            names = set()
+        return names, set()
+    collector = _ReferenceCollector()
+    collector.visit(tree)
+    return collector.definition_names, collector.call_names - collector.definition_names
+
+def build_dependency_graph(modules):
+    """Map each module's name to {dependency: at_definition} for the other modules its source refers to.
+
+    at_definition is True when the dependency is needed as soon as the module's code runs (for
+    example a base class), and False when it is only used inside function bodies. Each source is
+    parsed once, so building the graph is linear in the total size of the sources.
+    """
+    names = {mod['name'] for mod in modules}
+    dependencies = {}
+    for mod in modules:
+        definition_names, call_names = classify_references(mod.get('source') or '')
+        deps = dependencies.setdefault(mod['name'], {})
+        for dep in call_names & names - {mod['name']}:
+            deps.setdefault(dep, False)
+        for dep in definition_names & names - {mod['name']}:
+            deps[dep] = True
+    return {name: dict(sorted(deps.items())) for name, deps in dependencies.items()}
+
+def find_dependency_cycle(names, dependencies):
+    """Return one dependency cycle among names as a list like [a, b, a], or None."""
+    names = list(names)
+    members = set(names)
+    visiting, done = [], set()
+    on_path = {}
+    for root in names:
+        if root in done:
+            continue
+        stack = [(root, iter(dependencies.get(root, ())))]
+        on_path[root] = len(visiting)
+        visiting.append(root)
+        while stack:
+            name, deps = stack[-1]
+            for dep in deps:
+                if dep not in members or dep in done:
+                    continue
+                if dep in on_path:
+                    return visiting[on_path[dep]:] + [dep]
+                on_path[dep] = len(visiting)
+                visiting.append(dep)
+                stack.append((dep, iter(dependencies.get(dep, ()))))
                 break
+            else:
+                stack.pop()
+                visiting.pop()
+                del on_path[name]
+                done.add(name)
+    return None
 
-    return sorted_modules
+def sort_modules(modules, dependencies):
+    """Order modules so each comes after the modules it depends on (Kahn's algorithm).
 
-# Define a function to extract dependencies from the source code
-def extract_dependencies(module, modules):
-    dependencies = []
+    dependencies is the graph from build_dependency_graph. Modules that are ready keep their
+    original relative order. Dependency cycles are broken at a dependency that is only used at
+    call time, which is safe because every module is defined by the time a function runs. A cycle
+    of dependencies that are all needed at definition time can't be ordered and raises ValueError.
+    """
+    by_name = {}
     for mod in modules:
-        if mod['name'] != module['name']:
-            # Use a negative lookahead to exclude matches within quotes
-            pattern = r'\b' + re.escape(mod['name']) + r'\b(?=([^"\']*["\'][^"\']*["\'])*[^"\']*$)'
-            if re.search(pattern, module['source']):
-                dependencies.append(mod['name'])
-    return dependencies
-
-def load_input_schema(repo_name):
-    """Loads the input schema"""
+        by_name.setdefault(mod['name'], []).append(mod)
+
+    dependents = {name: [] for name in by_name}
+    remaining = {}
+    for name in by_name:
+        deps = set(dependencies.get(name, ())) & by_name.keys() - {name}
+        remaining[name] = len(deps)
+        for dep in deps:
+            dependents[dep].append(name)
+
+    ready = deque(name for name in by_name if remaining[name] == 0)
+    sorted_names, placed = [], set()
+    broken = set()
+    while len(sorted_names) < len(by_name):
+        if not ready:
+            # Everything left waits on a cycle: break it at a call-time dependency
+            unsorted = [name for name in by_name if name not in placed]
+            active = {
+                name: [dep for dep in dependencies.get(name, ()) if (name, dep) not in broken]
+                for name in unsorted
+            }
+            cycle = find_dependency_cycle(unsorted, active)
+            edge = next(
+                ((name, dep) for name, dep in zip(cycle, cycle[1:]) if not dependencies[name][dep]),
+                None
+            )
+            if edge is None:
+                raise ValueError(
+                    f"Circular dependency between local modules that are all needed at definition time: {' -> '.join(cycle)}"
+                )
+            name, dep = edge
+            logger.info(f"Circular dependency between local modules: {' -> '.join(cycle)}. "
+                        f"Defining {name} before {dep}, which it only uses at call time")
+            broken.add(edge)
+            remaining[name] -= 1
+            if remaining[name] == 0:
+                ready.append(name)
+            continue
+        name = ready.popleft()
+        sorted_names.append(name)
+        placed.add(name)
+        for dependent in dependents[name]:
+            if (dependent, name) in broken:
+                continue
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+
+    return [mod for name in sorted_names for mod in by_name[name]]
+
+def load_input_schema(repo_name, reload=False):
+    """Loads the input schema, re-importing it if reload is set and it was imported before"""
     schemas_module = importlib.import_module(f"{repo_name}.schemas")
+    if reload:
+        importlib.invalidate_caches()
+        schemas_module = importlib.reload(schemas_module)
     input_schema = getattr(schemas_module, "Persona")
     return input_schema
 
-def load_persona(persona_url):
-    """Load persona from a JSON or YAML file in a git repository."""
+def _remote_head(repo_url):
+    output = Git().ls_remote(repo_url, "HEAD")
+    return output.split()[0] if output else None
+
+def fetch_persona_repo(persona_url, commit=None):
+    """Check out a persona repo at a commit in the local persona cache and return (repo_path, commit).
+
+    Without a commit, the remote HEAD is used; it is only looked up again once the last lookup is
+    older than PERSONA_CACHE_TTL. Checkouts are shallow and only fetch when the commit changes.
+    """
+    repo_name = persona_url.split('/')[-1]
+    url_hash = hashlib.sha1(persona_url.encode()).hexdigest()[:12]
+    repo_path = get_cache_dir("personas") / f"{repo_name}-{url_hash}"
+    cached = _persona_cache.get(persona_url) or {}
+
+    checked_at = cached.get("checked_at", 0)
+    if commit is None:
+        if cached.get("commit") and time.time() - checked_at < PERSONA_CACHE_TTL:
+            commit = cached["commit"]
+        else:
+            commit = _remote_head(persona_url)
+            checked_at = time.time()
+
+    if (repo_path / ".git").exists():
+        repo = Repo(repo_path)
+    else:
+        logger.info(f"Cloning persona {persona_url}")
+        repo = Repo.clone_from(persona_url, to_path=str(repo_path), depth=1, single_branch=True)
+    if commit and not repo.head.commit.hexsha.startswith(commit):
+        logger.info(f"Fetching persona {persona_url} at {commit}")
+        repo.git.fetch("--depth=1", "origin", commit)
+        repo.git.reset("--hard", "FETCH_HEAD")
+
+    commit = repo.head.commit.hexsha
+    _persona_cache.set(persona_url, {**cached, "commit": commit, "checked_at": checked_at})
+    return repo_path, commit
+
+def install_persona(persona_url, commit):
+    """Add a persona package at a commit to the current poetry project, unless it is already installed.
+
+    The install is only skipped if the package still resolves, since the project's virtualenv may
+    have been recreated since it was recorded.
+    """
+    project = str(Path.cwd())
+    with _persona_install_lock:
+        cached = _persona_cache.get(persona_url) or {}
+        installed = cached.get("installed", {})
+        if installed.get(project) == commit and _persona_package_installed(persona_url):
+            return
+        subprocess.run(["poetry", "add", f"git+{persona_url}#{commit}"], check=True, capture_output=True, text=True)
+        _persona_cache.set(persona_url, {**cached, "installed": {**installed, project: commit}})
+
+def _persona_package_installed(persona_url):
+    importlib.invalidate_caches()
+    try:
+        return importlib.util.find_spec(persona_url.split('/')[-1]) is not None
+    except (ImportError, ValueError):
+        return False
+
+def load_persona(persona_url, commit=None):
+    """Load persona from a JSON or YAML file in a git repository.
+
+    Repos are cached by URL and commit (see fetch_persona_repo), and each persona is loaded once per
+    process and commit, so deployments sharing a persona reuse it. Without a commit, the remote HEAD
+    is rechecked every PERSONA_CACHE_TTL seconds, so long-running processes pick up new commits.
+    """
+    with _persona_locks.setdefault(persona_url, threading.Lock()):
+        try:
+            repo_path, commit = fetch_persona_repo(persona_url, commit)
+        except Exception as e:
+            logger.error(f"Error loading persona from {persona_url}: {e}")
+            return None
+        key = (persona_url, commit)
+        if key not in _loaded_personas:
+            # A persona loaded at an older commit has its schema module imported already
+            stale = [loaded for loaded in _loaded_personas if loaded[0] == persona_url]
+            persona = _load_persona(persona_url, repo_path, commit, reload_schema=bool(stale))
+            if persona is None:
+                return None
+            for loaded in stale:
+                del _loaded_personas[loaded]
+            _loaded_personas[key] = persona
+        return _loaded_personas[key]
+
+def _load_persona(persona_url, repo_path, commit, reload_schema=False):
     try:
-        # Clone the repo
         repo_name = persona_url.split('/')[-1]
-        repo_path = Path(f"{AGENT_DIR}/{repo_name}")
-        
-        # Remove existing repo if it exists
-        if repo_path.exists():
-            import shutil
-            shutil.rmtree(repo_path)
-            
-        _ = Repo.clone_from(persona_url, to_path=str(repo_path))
-        
+
         # Look for files in data subdirectory
         data_dir = repo_path / repo_name / "data"
         if not data_dir.exists():
@@ -340,7 +851,7 @@ def load_persona(persona_url):
             return None
             
         # Get first file in data dir
-        data_files = list(data_dir.iterdir())
+        data_files = sorted(data_dir.iterdir())
         if not data_files:
             logger.error(f"No files found in data directory of repository {repo_name}")
             return None
@@ -357,12 +868,11 @@ def load_persona(persona_url):
                 logger.error(f"Unsupported file type {persona_file.suffix} in {repo_name}")
                 return None
             
-        subprocess.run(["poetry", "add", f"git+{persona_url}"], check=True, capture_output=True, text=True)
+        install_persona(persona_url, commit)
 
-        input_schema = load_input_schema(repo_name)
+        input_schema = load_input_schema(repo_name, reload=reload_schema)
         return persona_data, input_schema
         
     except Exception as e:
         logger.error(f"Error loading persona from {persona_url}: {e}")
         return None
-    
\ No newline at end of file
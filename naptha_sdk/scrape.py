@@ -1,6 +1,6 @@
 import ast
 import inspect
-from naptha_sdk.package_manager import sort_modules, extract_dependencies
+from naptha_sdk.package_manager import build_dependency_graph, sort_modules
 import os
 from pathlib import Path
 import sys
@@ -8,6 +8,37 @@ import typing
 from typing import TypeVar
 import yaml
 
+# Variables scraped from caller files, by path, and sources of scraped objects, by object id. Entries
+# are reused while the file's mtime and size are unchanged, so agents declared in the same file and
+# repeat builds in one process don't re-read and re-parse it.
+_init_cache = {}
+_source_cache = {}
+
+def _file_key(file_path):
+    try:
+        stat = os.stat(file_path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def clear_scrape_cache():
+    _init_cache.clear()
+    _source_cache.clear()
+
+def get_source(obj):
+    """inspect.getsource, cached until the file defining obj changes."""
+    try:
+        file_key = _file_key(inspect.getsourcefile(obj))
+    except TypeError:
+        file_key = None
+    cached = _source_cache.get(id(obj))
+    # Keep a reference to obj in the entry so its id can't be reused by another object
+    if cached is not None and cached[0] is obj and file_key is not None and cached[1] == file_key:
+        return cached[2]
+    source = inspect.getsource(obj)
+    _source_cache[id(obj)] = (obj, file_key, source)
+    return source
+
 def is_local_module(module):
     if not hasattr(module, '__file__'):
         return False  # Built-in modules don't have __file__
@@ -26,6 +57,12 @@ def is_local_module(module):
     return False  # It's outside the project directory
 
 def scrape_init(file_path):
+    file_path = os.path.abspath(file_path)
+    file_key = _file_key(file_path)
+    cached = _init_cache.get(file_path)
+    if cached is not None and cached[0] == file_key:
+        return [dict(variable) for variable in cached[1]]
+
     def extract_value(value):
         if isinstance(value, ast.Constant):
             return value.value
@@ -63,8 +100,9 @@ def scrape_init(file_path):
 
     # Convert the dictionary values back to a list
     variables = list(unique_variables.values())
+    _init_cache[file_path] = (file_key, variables)
 
-    return variables
+    return [dict(variable) for variable in variables]
 
 def get_obj_dependencies(context_globals, fn_code, processed=None):
     if processed is None:
@@ -117,7 +155,7 @@ def get_obj_dependencies(context_globals, fn_code, processed=None):
                         if isinstance(obj, TypeVar):
                             obj_info['source'] = ""
                         else:
-                            obj_info['source'] = inspect.getsource(obj)
+                            obj_info['source'] = get_source(obj)
                             new_modules, new_variables = get_obj_dependencies(module.__dict__, obj_info['source'], processed)
                             modules.extend(new_modules)
                             variables.extend(new_variables)
@@ -144,8 +182,8 @@ def scrape_func_params(func):
     
     return params
 
-def scrape_func(func, variables):
-    fn_code = inspect.getsource(func)
+def scrape_func(func, variables, context_globals=None):
+    fn_code = get_source(func)
     fn_name = func.__name__
     fn_code = "\n".join(line for line in fn_code.splitlines() if not line.strip().startswith("@"))
 
@@ -155,11 +193,13 @@ def scrape_func(func, variables):
         if variable['target'] in fn_code:
             used_variables.append(variable)
 
-    if inspect.isfunction(func):
-        context_globals = func.__globals__
-    elif inspect.isclass(func):
-        module = sys.modules[func.__module__]
-        context_globals = module.__dict__
+    # context_globals can be a snapshot of the declaring module's globals taken while it was importing
+    if context_globals is None:
+        if inspect.isfunction(func):
+            context_globals = func.__globals__
+        elif inspect.isclass(func):
+            module = sys.modules[func.__module__]
+            context_globals = module.__dict__
 
     modules, new_variables = get_obj_dependencies(context_globals, fn_code)
     used_variables.extend(new_variables)
@@ -227,7 +267,7 @@ def scrape_func(func, variables):
 
     modules = [module for module in modules if module['name'] != 'logger']
     local_modules = [module for module in modules if module['is_local']]
-    module_dependencies = {mod['name']: extract_dependencies(mod, local_modules) for mod in local_modules}
+    module_dependencies = build_dependency_graph(local_modules)
     local_modules = sort_modules(local_modules, module_dependencies) # Sort local modules based on dependencies
     selective_import_modules = [module for module in modules if not module['is_local'] and module['import_type'] == 'selective']
     standard_import_modules = [module for module in modules if module['import_type'] == 'standard']
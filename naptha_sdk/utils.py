@@ -1,5 +1,9 @@
+import fnmatch
 import logging
 import os
+import shutil
+import stat
+import zipfile
 
 import yaml
 
@@ -16,6 +20,118 @@ def get_logger(name):
     logger.addHandler(handler)
     return logger
 
+logger = get_logger(__name__)
+
+# Fixed settings so that identical files always produce byte-identical archives (and the same IPFS hash)
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+ZIP_COMPRESSION = zipfile.ZIP_DEFLATED
+ZIP_COMPRESSLEVEL = 6
+
+def write_deterministic_zip(zip_path, files):
+    """Write (file_path, arcname) pairs to a zip archive that only depends on the file contents.
+
+    Entries are sorted by arcname and written with a fixed timestamp, normalized permissions
+    (0644, or 0755 for executables) and fixed compression settings.
+    """
+    entries = sorted((arcname.replace(os.sep, "/"), file_path) for file_path, arcname in files)
+    with zipfile.ZipFile(zip_path, "w", ZIP_COMPRESSION, compresslevel=ZIP_COMPRESSLEVEL) as zip_file:
+        for arcname, file_path in entries:
+            info = zipfile.ZipInfo(arcname, date_time=ZIP_EPOCH)
+            info.create_system = 3
+            info.compress_type = ZIP_COMPRESSION
+            mode = 0o755 if os.access(file_path, os.X_OK) else 0o644
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            with open(file_path, "rb") as src, zip_file.open(info, "w") as dest:
+                shutil.copyfileobj(src, dest, 1024 * 1024)
+    return zip_path
+
+# Paths never worth shipping in a package, on top of any patterns in the package's .naptignore
+DEFAULT_IGNORE_PATTERNS = [
+    ".git/", ".venv/", "venv/", "__pycache__/", "*.py[cod]", ".pytest_cache/", ".mypy_cache/",
+    ".ruff_cache/", ".ipynb_checkpoints/", "*.egg-info/", ".DS_Store", ".env",
+]
+IGNORE_FILE = ".naptignore"
+
+def load_ignore_patterns(directory_path):
+    """Parse the default ignore patterns and the directory's .naptignore into (negate, parts, dir_only) rules.
+
+    The .naptignore file uses a subset of the .gitignore syntax: one glob per line, # comments,
+    a trailing / to only match directories, a leading or inner / to match the path relative to
+    the package root instead of a name at any depth, ** to match any number of directories, and
+    a leading ! to re-include a path. Wildcards never match across a /.
+    """
+    lines = list(DEFAULT_IGNORE_PATTERNS)
+    ignore_file = os.path.join(directory_path, IGNORE_FILE)
+    if os.path.isfile(ignore_file):
+        with open(ignore_file, "r") as file:
+            lines.extend(file.read().splitlines())
+
+    patterns = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        parts = tuple(line.lstrip("/").split("/"))
+        if "/" not in line:
+            # A bare name matches at any depth
+            parts = ("**",) + parts
+        patterns.append((negate, parts, dir_only))
+    return patterns
+
+def _match_parts(pattern_parts, path_parts):
+    if not pattern_parts:
+        return not path_parts
+    if pattern_parts[0] == "**":
+        return any(_match_parts(pattern_parts[1:], path_parts[i:]) for i in range(len(path_parts) + 1))
+    return (
+        bool(path_parts)
+        and fnmatch.fnmatchcase(path_parts[0], pattern_parts[0])
+        and _match_parts(pattern_parts[1:], path_parts[1:])
+    )
+
+def is_ignored(rel_path, is_dir, patterns):
+    path_parts = tuple(rel_path.replace(os.sep, "/").split("/"))
+    ignored = False
+    for negate, pattern_parts, dir_only in patterns:
+        if dir_only and not is_dir:
+            continue
+        if _match_parts(pattern_parts, path_parts):
+            ignored = not negate
+    return ignored
+
+def list_package_files(directory_path):
+    """List (file_path, path relative to directory_path) for the files to ship, skipping ignored paths."""
+    patterns = load_ignore_patterns(directory_path)
+    files = []
+    for root, dirs, filenames in os.walk(directory_path):
+        rel_root = os.path.relpath(root, directory_path)
+        rel_root = "" if rel_root == "." else rel_root
+        dirs[:] = sorted(d for d in dirs if not is_ignored(os.path.join(rel_root, d), True, patterns))
+        for file in filenames:
+            rel_path = os.path.join(rel_root, file)
+            if not is_ignored(rel_path, False, patterns):
+                files.append((os.path.join(root, file), rel_path))
+    return files
+
+def log_package_size_report(directory_path, files, top_n=5):
+    """Log how many files and bytes are shipped from a directory, and the largest files."""
+    sizes = sorted(((os.path.getsize(file_path), rel_path) for file_path, rel_path in files), reverse=True)
+    total = sum(size for size, _ in sizes)
+    largest = ", ".join(f"{rel_path} ({_format_size(size)})" for size, rel_path in sizes[:top_n])
+    logger.info(f"Packaging {len(files)} files ({_format_size(total)}) from {directory_path}. Largest: {largest}")
+
+def _format_size(num_bytes):
+    for unit in ["B", "KB", "MB"]:
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
 def load_yaml(cfg_path):
     with open(cfg_path, "r") as file:
         cfg = yaml.load(file, Loader=yaml.FullLoader)